@@ -98,6 +98,42 @@ def main():
                         help="Store shader graphs into JSON format")
     parser.add_argument("--use-scene-fps", dest="use_scene_fps", action="store_true", default=False,
                         help="Use current scene FPS")
+    parser.add_argument("-f", "--format", dest="output_format", choices=["osgt", "osgb"], default="osgt",
+                        help="Output format, ascii (osgt) or binary (osgb)")
+    parser.add_argument("--streaming", dest="streaming", action="store_true", default=False,
+                        help="Write objects as soon as they are converted to reduce memory usage (osgt only)")
+    parser.add_argument("-z", "--compression", dest="compression", choices=["none", "gzip", "xz", "zstd"],
+                        default="none", help="Compress the output file while it is written")
+    parser.add_argument("--compression-level", dest="compression_level", type=int, default=None,
+                        help="Compression level, the codec default if not set")
+    parser.add_argument("--write-processes", dest="write_processes", type=int, default=1,
+                        help="Number of processes serializing the top level objects, 0 for one per core")
+    parser.add_argument("--convert-processes", dest="convert_processes", type=int, default=1,
+                        help="Number of processes converting the geometries, 0 for one per core")
+    parser.add_argument("--optimize-vertex-cache", dest="optimize_vertex_cache", action="store_true", default=False,
+                        help="Reorder triangles and vertices for the GPU vertex cache")
+    parser.add_argument("--optimize-overdraw", dest="optimize_overdraw", action="store_true", default=False,
+                        help="Reorder clusters of triangles to reduce overdraw, after the vertex cache optimization")
+    parser.add_argument("--overdraw-threshold", dest="overdraw_threshold", type=float, default=1.05,
+                        help="ACMR increase allowed by the overdraw optimization, 1.05 for 5%%")
+    parser.add_argument("--lod-levels", dest="lod_levels", type=int, default=0,
+                        help="Number of simplified levels of detail generated for each static mesh")
+    parser.add_argument("--lod-ratio", dest="lod_ratio", type=float, default=0.5,
+                        help="Triangles kept by each level of detail from the previous one")
+    parser.add_argument("--initial-bounds", dest="initial_bounds", action="store_true", default=False,
+                        help="Write the bounds of the static nodes and geometries")
+    parser.add_argument("--split-geometries", dest="split_geometries", action="store_true", default=False,
+                        help="Split geometries with more than 65535 vertices to use 16 bit indexes")
+    parser.add_argument("--triangulate-quads", dest="triangulate_quads", action="store_true", default=False,
+                        help="Write quads as triangles in one primitive set per geometry")
+    parser.add_argument("--relative-morphs", dest="relative_morph_targets", action="store_true", default=False,
+                        help="Write morph targets as offsets from the geometry vertices")
+    parser.add_argument("--max-influences", dest="max_influences", type=int, default=4,
+                        help="Strongest bone influences kept for each vertex, 0 keeps them all")
+    parser.add_argument("--cache-dir", dest="cache_directory", default="",
+                        help="Directory where converted geometries are kept between exports")
+    parser.add_argument("--cache-size", dest="cache_size", type=int, default=1024,
+                        help="Size of the geometry cache in megabytes")
 
     args = parser.parse_args(argv)  # In this example we wont use the args
 
@@ -114,6 +150,24 @@ def main():
         config.scene = bpy.context.scene
         config.json_materials = args.json_materials
         config.json_shaders = args.json_shaders
+        config.output_format = args.output_format
+        config.streaming = args.streaming
+        config.compression = args.compression
+        config.compression_level = args.compression_level
+        config.write_processes = args.write_processes
+        config.convert_processes = args.convert_processes
+        config.optimize_vertex_cache = args.optimize_vertex_cache
+        config.optimize_overdraw = args.optimize_overdraw
+        config.overdraw_threshold = args.overdraw_threshold
+        config.lod_levels = args.lod_levels
+        config.lod_ratio = args.lod_ratio
+        config.initial_bounds = args.initial_bounds
+        config.split_geometries = args.split_geometries
+        config.triangulate_quads = args.triangulate_quads
+        config.relative_morph_targets = args.relative_morph_targets
+        config.max_influences = args.max_influences
+        config.cache_directory = args.cache_directory
+        config.cache_size = args.cache_size
         if args.use_scene_fps:
             config.anim_fps = config.scene.render.fps
         OpenSceneGraphExport(config)
@@ -210,6 +264,58 @@ class OSGGUI(bpy.types.Operator, ExportHelper):
     TEXTURE_PREFIX = StringProperty(name="texture prefix", default="")
     EXPORT_ALL_SCENES = BoolProperty(name="Export all scenes", default=False)
     ZERO_TRANSLATIONS = BoolProperty(name="Zero world translations", default=False)
+    OUTPUT_FORMAT = EnumProperty(name="Format", description="Output file format",
+                                 items=(("osgt", "Ascii (.osgt)", ""), ("osgb", "Binary (.osgb)", "")),
+                                 default="osgt")
+    STREAMING = BoolProperty(name="Streaming export",
+                             description="Write objects as soon as they are converted to reduce memory usage",
+                             default=False)
+    COMPRESSION = EnumProperty(name="Compression", description="Compress the output file while it is written",
+                               items=(("none", "None", ""), ("gzip", "Gzip (.gz)", ""), ("xz", "Xz (.xz)", ""),
+                                      ("zstd", "Zstandard (.zst)", "")),
+                               default="none")
+    WRITE_PROCESSES = IntProperty(name="Write processes",
+                                  description="Processes serializing the top level objects, 0 for one per core",
+                                  min=0, max=64, default=1)
+    CONVERT_PROCESSES = IntProperty(name="Convert processes",
+                                    description="Processes converting the geometries, 0 for one per core",
+                                    min=0, max=64, default=1)
+    OPTIMIZE_VERTEX_CACHE = BoolProperty(name="Optimize vertex cache",
+                                         description="Reorder triangles and vertices for the GPU vertex cache",
+                                         default=False)
+    OPTIMIZE_OVERDRAW = BoolProperty(name="Optimize overdraw",
+                                     description="Reorder clusters of triangles to reduce overdraw",
+                                     default=False)
+    OVERDRAW_THRESHOLD = FloatProperty(name="Overdraw ACMR threshold",
+                                       description="ACMR increase allowed by the overdraw optimization",
+                                       min=1.0, max=3.0, default=1.05)
+    LOD_LEVELS = IntProperty(name="LOD levels",
+                             description="Simplified levels of detail generated for each static mesh",
+                             min=0, max=8, default=0)
+    LOD_RATIO = FloatProperty(name="LOD ratio",
+                              description="Triangles kept by each level of detail from the previous one",
+                              min=0.05, max=0.95, default=0.5)
+    INITIAL_BOUNDS = BoolProperty(name="Write bounds",
+                                  description="Write the bounds of the static nodes and geometries",
+                                  default=False)
+    SPLIT_GEOMETRIES = BoolProperty(name="Split geometries",
+                                    description="Split geometries with more than 65535 vertices to use 16 bit indexes",
+                                    default=False)
+    TRIANGULATE_QUADS = BoolProperty(name="Triangulate quads",
+                                     description="Write quads as triangles in one primitive set per geometry",
+                                     default=False)
+    RELATIVE_MORPHS = BoolProperty(name="Relative morph targets",
+                                   description="Write morph targets as offsets from the geometry vertices",
+                                   default=False)
+    MAX_INFLUENCES = IntProperty(name="Max influences",
+                                 description="Strongest bone influences kept for each vertex, 0 keeps them all",
+                                 min=0, max=16, default=4)
+    CACHE_DIRECTORY = StringProperty(name="Cache directory", subtype="DIR_PATH",
+                                     description="Directory where converted geometries are kept between exports",
+                                     default="")
+    CACHE_SIZE = IntProperty(name="Cache size (MB)",
+                             description="Size of the geometry cache in megabytes",
+                             min=1, max=65536, default=1024)
 
     def draw(self, context):
         layout = self.layout
@@ -234,6 +340,23 @@ class OSGGUI(bpy.types.Operator, ExportHelper):
         layout.row(align=True).prop(self, "EXPORT_REST")
         layout.row(align=True).prop(self, "FLOATPRE")
         layout.row(align=True).prop(self, "INDENT")
+        layout.row(align=True).prop(self, "OUTPUT_FORMAT")
+        layout.row(align=True).prop(self, "STREAMING")
+        layout.row(align=True).prop(self, "COMPRESSION")
+        layout.row(align=True).prop(self, "WRITE_PROCESSES")
+        layout.row(align=True).prop(self, "CONVERT_PROCESSES")
+        layout.row(align=True).prop(self, "OPTIMIZE_VERTEX_CACHE")
+        layout.row(align=True).prop(self, "OPTIMIZE_OVERDRAW")
+        layout.row(align=True).prop(self, "OVERDRAW_THRESHOLD")
+        layout.row(align=True).prop(self, "LOD_LEVELS")
+        layout.row(align=True).prop(self, "LOD_RATIO")
+        layout.row(align=True).prop(self, "INITIAL_BOUNDS")
+        layout.row(align=True).prop(self, "SPLIT_GEOMETRIES")
+        layout.row(align=True).prop(self, "TRIANGULATE_QUADS")
+        layout.row(align=True).prop(self, "RELATIVE_MORPHS")
+        layout.row(align=True).prop(self, "MAX_INFLUENCES")
+        layout.row(align=True).prop(self, "CACHE_DIRECTORY")
+        layout.row(align=True).prop(self, "CACHE_SIZE")
         layout.row(align=True).label("Texture Prefix:")
         layout.row(align=True).prop(self, "TEXTURE_PREFIX", text="")
         layout.row(align=True).prop(self, "OSGCONV_TO_IVE")
@@ -283,6 +406,23 @@ class OSGGUI(bpy.types.Operator, ExportHelper):
         self.VIEWER_PATH = self.config.viewer_path
         self.TEXTURE_PREFIX = self.config.texture_prefix
         self.EXPORT_ALL_SCENES = self.config.export_all_scenes
+        self.OUTPUT_FORMAT = self.config.output_format
+        self.STREAMING = self.config.streaming
+        self.COMPRESSION = self.config.compression
+        self.WRITE_PROCESSES = self.config.write_processes
+        self.CONVERT_PROCESSES = self.config.convert_processes
+        self.OPTIMIZE_VERTEX_CACHE = self.config.optimize_vertex_cache
+        self.OPTIMIZE_OVERDRAW = self.config.optimize_overdraw
+        self.OVERDRAW_THRESHOLD = self.config.overdraw_threshold
+        self.LOD_LEVELS = self.config.lod_levels
+        self.LOD_RATIO = self.config.lod_ratio
+        self.INITIAL_BOUNDS = self.config.initial_bounds
+        self.SPLIT_GEOMETRIES = self.config.split_geometries
+        self.TRIANGULATE_QUADS = self.config.triangulate_quads
+        self.RELATIVE_MORPHS = self.config.relative_morph_targets
+        self.MAX_INFLUENCES = self.config.max_influences
+        self.CACHE_DIRECTORY = self.config.cache_directory
+        self.CACHE_SIZE = self.config.cache_size
 
         if bpy.data.filepath in self.config.history:
             self.filepath = self.config.history[bpy.data.filepath]
@@ -322,6 +462,23 @@ class OSGGUI(bpy.types.Operator, ExportHelper):
         self.config.osgconv_embed_textures = self.OSGCONV_EMBED_TEXTURES
         self.config.export_all_scenes = self.EXPORT_ALL_SCENES
         self.config.osgconv_cleanup = self.OSGCONV_CLEANUP
+        self.config.output_format = self.OUTPUT_FORMAT
+        self.config.streaming = self.STREAMING
+        self.config.compression = self.COMPRESSION
+        self.config.write_processes = self.WRITE_PROCESSES
+        self.config.convert_processes = self.CONVERT_PROCESSES
+        self.config.optimize_vertex_cache = self.OPTIMIZE_VERTEX_CACHE
+        self.config.optimize_overdraw = self.OPTIMIZE_OVERDRAW
+        self.config.overdraw_threshold = self.OVERDRAW_THRESHOLD
+        self.config.lod_levels = self.LOD_LEVELS
+        self.config.lod_ratio = self.LOD_RATIO
+        self.config.initial_bounds = self.INITIAL_BOUNDS
+        self.config.split_geometries = self.SPLIT_GEOMETRIES
+        self.config.triangulate_quads = self.TRIANGULATE_QUADS
+        self.config.relative_morph_targets = self.RELATIVE_MORPHS
+        self.config.max_influences = self.MAX_INFLUENCES
+        self.config.cache_directory = self.CACHE_DIRECTORY
+        self.config.cache_size = self.CACHE_SIZE
 
         try:
             cfg = os.path.join(bpy.utils.user_resource('CONFIG'), "osgExport.cfg")
@@ -0,0 +1,594 @@
+# -*- python-indent: 4; mode: python -*-
+# -*- coding: UTF-8 -*-
+#
+# Copyright (C) 2008-2012 Cedric Pinson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#  Cedric Pinson <cedric@plopbyte.com>
+
+# Native osgb writer. The layout follows the osgDB serializer wrappers
+# for file version 92 (the version written in the osgt header): every
+# class is written as the list of its associates (osg::Object, osg::Node,
+# ...) and each associate writes all its serializers in order, without
+# property names and without binary brackets.
+
+import bpy
+import struct
+import sys
+from array import array
+from .osgobject import *
+
+OSG_HEADER_LOW = 0x6C910EA1
+OSG_HEADER_HIGH = 0x1AFB4545
+WRITE_SCENE = 1
+SOVERSION = 92
+
+# osgDB/DataTypes
+ARRAY_TYPES = {"FloatArray": (6, 1),
+               "Vec2fArray": (15, 2),
+               "Vec3fArray": (16, 3),
+               "Vec4fArray": (17, 4)}
+ID_DRAWELEMENTS = {"DrawElementsUByte": (52, 'B'),
+                   "DrawElementsUShort": (53, 'H'),
+                   "DrawElementsUInt": (54, 'I')}
+
+GL_ENUMS = {"GL_POINTS": 0x0000,
+            "GL_LINES": 0x0001,
+            "GL_TRIANGLES": 0x0004,
+            "GL_QUADS": 0x0007,
+            "GL_CULL_FACE": 0x0B44,
+            "GL_LIGHTING": 0x0B50,
+            "GL_DEPTH_TEST": 0x0B71,
+            "GL_BLEND": 0x0BE2,
+            "GL_TEXTURE_2D": 0x0DE1,
+            "NEAREST": 0x2600,
+            "LINEAR": 0x2601,
+            "NEAREST_MIPMAP_NEAREST": 0x2700,
+            "LINEAR_MIPMAP_NEAREST": 0x2701,
+            "NEAREST_MIPMAP_LINEAR": 0x2702,
+            "LINEAR_MIPMAP_LINEAR": 0x2703,
+            "CLAMP": 0x2900,
+            "REPEAT": 0x2901,
+            "CLAMP_TO_BORDER": 0x812D,
+            "CLAMP_TO_EDGE": 0x812F,
+            "MIRROR": 0x8370}
+GL_LIGHT0 = 0x4000
+GL_LEQUAL = 0x0203
+GL_LUMINANCE = 0x1909
+
+MODE_VALUES = {"OFF": 0x0, "ON": 0x1, "OVERRIDE": 0x2, "PROTECTED": 0x4, "INHERIT": 0x8}
+DATA_VARIANCES = {"DYNAMIC": 0, "STATIC": 1}
+DATA_VARIANCE_UNSPECIFIED = 2
+MATERIAL_COLOR_MODES = {"AMBIENT": 0x1200,
+                        "DIFFUSE": 0x1201,
+                        "SPECULAR": 0x1202,
+                        "EMISSION": 0x1600,
+                        "AMBIENT_AND_DIFFUSE": 0x1602,
+                        "OFF": 0x1603}
+LIGHT_COLOR_CONTROLS = {"SINGLE_COLOR": 0x81F9,
+                        "SEPARATE_SPECULAR_COLOR": 0x81FA}
+INTERNAL_FORMAT_MODES = {"USE_IMAGE_DATA_FORMAT": 0,
+                         "USE_USER_DEFINED_FORMAT": 1}
+LOD_CENTER_MODES = {"USE_BOUNDING_SPHERE_CENTER": 0,
+                    "USER_DEFINED_CENTER": 1,
+                    "UNION_OF_BOUNDING_SPHERE_AND_USER_DEFINED": 2}
+LOD_RANGE_MODES = {"DISTANCE_FROM_EYE_POINT": 0,
+                   "PIXEL_SIZE_ON_SCREEN": 1}
+MORPH_METHODS = {"NORMALIZED": 0,
+                 "RELATIVE": 1}
+BIND_PER_VERTEX = 4
+TRANSPARENT_BIN = 2
+ANIMATION_LOOP = 2
+IMAGE_EXTERNAL = 2
+
+CHANNEL_VALUES = {"FloatLinearChannel": ('f', 1),
+                  "Vec3LinearChannel": ('f', 3),
+                  "QuatSphericalLinearChannel": ('d', 4)}
+
+
+def glEnum(name):
+    if name.startswith("GL_LIGHT") and name[8:].isdigit():
+        return GL_LIGHT0 + int(name[8:])
+    if name not in GL_ENUMS:
+        raise ValueError("osgb: unsupported GL enum {}".format(name))
+    return GL_ENUMS[name]
+
+
+class BinaryOutput(object):
+    """
+    Little endian stream with the primitive types of osgDB::BinaryOutputIterator
+    """
+    def __init__(self, output):
+        object.__init__(self)
+        self.output = output
+
+    def writeBool(self, value):
+        self.output.write(b'\x01' if value else b'\x00')
+
+    def writeInt(self, value):
+        self.output.write(struct.pack('<i', value))
+
+    def writeUInt(self, value):
+        self.output.write(struct.pack('<I', value))
+
+    def writeFloat(self, value):
+        self.output.write(struct.pack('<f', value))
+
+    def writeDouble(self, value):
+        self.output.write(struct.pack('<d', value))
+
+    def writeFloats(self, values):
+        self.output.write(struct.pack('<%df' % len(values), *values))
+
+    def writeDoubles(self, values):
+        self.output.write(struct.pack('<%dd' % len(values), *values))
+
+    def writeString(self, value):
+        data = value.encode('utf-8')
+        self.output.write(struct.pack('<i', len(data)))
+        self.output.write(data)
+
+    def writeArray(self, typecode, values):
+        # float buffers of the vertex arrays are written without a copy
+        if isinstance(values, array) and values.typecode == typecode and sys.byteorder == 'little':
+            self.output.write(values)
+            return
+        buf = array(typecode, values)
+        if sys.byteorder != 'little':
+            buf.byteswap()
+        self.output.write(buf.tobytes())
+
+
+class BinaryWriter(object):
+    """
+    Serialize an osgobject scene graph to the osgb format
+    """
+    # associates of each osgDB wrapper, the serializers are written in this order
+    wrappers = {
+        "osg::Group": ("Object", "Node", "Group"),
+        "osg::MatrixTransform": ("Object", "Node", "Group", "Transform", "MatrixTransform"),
+        "osg::Geode": ("Object", "Node", "Geode"),
+        "osg::LOD": ("Object", "Node", "Group", "LOD"),
+        "osg::LightSource": ("Object", "Node", "Group", "LightSource"),
+        "osg::Geometry": ("Object", "Drawable", "Geometry"),
+        "osg::StateSet": ("Object", "StateSet"),
+        "osg::Material": ("Object", "StateAttribute", "Material"),
+        "osg::LightModel": ("Object", "StateAttribute", "LightModel"),
+        "osg::Light": ("Object", "StateAttribute", "Light"),
+        "osg::Texture2D": ("Object", "StateAttribute", "Texture", "Texture2D"),
+        "osg::DefaultUserDataContainer": ("Object", "DefaultUserDataContainer"),
+        "osg::StringValueObject": ("Object", "StringValueObject"),
+        "osgAnimation::Skeleton": ("Object", "Node", "Group", "Transform", "MatrixTransform"),
+        "osgAnimation::Bone": ("Object", "Node", "Group", "Transform", "MatrixTransform", "Bone"),
+        "osgAnimation::RigGeometry": ("Object", "Drawable", "Geometry", "RigGeometry"),
+        "osgAnimation::MorphGeometry": ("Object", "Drawable", "Geometry", "MorphGeometry"),
+        "osgAnimation::UpdateMatrixTransform": ("Object", "NodeCallback", "UpdateMatrixTransform"),
+        "osgAnimation::UpdateBone": ("Object", "NodeCallback", "UpdateMatrixTransform"),
+        "osgAnimation::UpdateSkeleton": ("Object", "NodeCallback"),
+        "osgAnimation::UpdateMorph": ("Object", "NodeCallback", "UpdateMorph"),
+        # drawable and state attribute callbacks, they have no serializer of their own
+        "osgAnimation::UpdateMorphGeometry": ("Object",),
+        "osgAnimation::UpdateMaterial": ("Object",),
+        "osgAnimation::BasicAnimationManager": ("Object", "NodeCallback", "AnimationManagerBase"),
+        "osgAnimation::Animation": ("Object", "Animation"),
+        "osgAnimation::StackedTranslateElement": ("Object", "StackedTranslateElement"),
+        "osgAnimation::StackedScaleElement": ("Object", "StackedScaleElement"),
+        "osgAnimation::StackedRotateAxisElement": ("Object", "StackedRotateAxisElement"),
+        "osgAnimation::StackedQuaternionElement": ("Object", "StackedQuaternionElement"),
+        "osgAnimation::StackedMatrixElement": ("Object", "StackedMatrixElement"),
+    }
+
+    def __init__(self, output):
+        object.__init__(self)
+        self.output = BinaryOutput(output)
+        self.object_ids = {}
+        self.array_ids = {}
+
+    def writeFile(self, root):
+        out = self.output
+        out.writeUInt(OSG_HEADER_LOW)
+        out.writeUInt(OSG_HEADER_HIGH)
+        out.writeUInt(WRITE_SCENE)
+        out.writeUInt(SOVERSION)
+        out.writeUInt(0)  # attributes: no custom domains, no schema, no binary brackets
+        out.writeString("0")  # no compressor
+        self.writeObject(root)
+
+    # objects --------------------------------------------------------
+    def writeObject(self, obj):
+        name = obj.getNameSpaceClass()
+        out = self.output
+        out.writeString(name)
+        new_id = obj not in self.object_ids
+        if new_id:
+            self.object_ids[obj] = len(self.object_ids) + 1
+        out.writeUInt(self.object_ids[obj])
+        if not new_id:
+            return
+        if name not in BinaryWriter.wrappers:
+            raise ValueError("osgb: no wrapper for {}".format(name))
+        for associate in BinaryWriter.wrappers[name]:
+            getattr(self, "serialize" + associate)(obj)
+
+    def writeObjectSerializer(self, obj):
+        self.output.writeBool(obj is not None)
+        if obj is not None:
+            self.writeObject(obj)
+
+    def writeObjectList(self, objects):
+        self.output.writeBool(len(objects) > 0)
+        if objects:
+            self.output.writeUInt(len(objects))
+            for obj in objects:
+                self.writeObject(obj)
+
+    def writeMatrix(self, matrix):
+        # same element order as Writer.writeMatrix
+        if matrix is None:
+            matrix = Matrix().to_4x4()
+        if bpy.app.version[0] >= 2 and bpy.app.version[1] >= 62:
+            values = [matrix[c][r] for r in range(4) for c in range(4)]
+        else:
+            values = [matrix[r][c] for r in range(4) for c in range(4)]
+        self.output.writeDoubles(values)
+
+    def writeObjectFields(self, name="", data_variance="UNKNOWN", userdata=None):
+        out = self.output
+        out.writeString("" if name == "None" else name)
+        out.writeInt(DATA_VARIANCES.get(data_variance, DATA_VARIANCE_UNSPECIFIED))
+        self.writeObjectSerializer(userdata)
+
+    # associates -----------------------------------------------------
+    def serializeObject(self, obj):
+        # the osgt writer stores the key of a StringValueObject as its name
+        name = obj.key if isinstance(obj, StringValueObject) else obj.name
+        self.writeObjectFields(name, obj.dataVariance, obj.userdata)
+
+    def serializeNodeCallback(self, callback):
+        self.writeObjectSerializer(getattr(callback, "nested_callback", None))
+
+    def serializeNode(self, node):
+        out = self.output
+        out.writeBool(node.initialBound is not None)
+        if node.initialBound is not None:
+            center, radius = node.initialBound
+            out.writeDoubles(center)
+            out.writeDouble(radius)
+        out.writeBool(False)  # ComputeBoundingSphereCallback
+        self.writeObjectSerializer(node.update_callbacks[0] if node.update_callbacks else None)
+        out.writeBool(False)  # EventCallback
+        out.writeBool(False)  # CullCallback
+        out.writeBool(node.cullingActive == "TRUE")
+        out.writeUInt(0xffffffff)  # NodeMask
+        out.writeBool(False)  # Descriptions
+        self.writeObjectSerializer(node.stateset)
+
+    def serializeGroup(self, group):
+        self.writeObjectList(group.children)
+
+    def serializeTransform(self, transform):
+        self.output.writeInt(0)  # ReferenceFrame RELATIVE_RF
+
+    def serializeMatrixTransform(self, transform):
+        self.writeMatrix(transform.matrix)
+
+    def serializeGeode(self, geode):
+        self.writeObjectList([d for d in geode.drawables if d is not None])
+
+    def serializeLOD(self, lod):
+        out = self.output
+        out.writeInt(LOD_CENTER_MODES[lod.centerMode])
+        out.writeBool(False)  # UserCenter
+        out.writeInt(LOD_RANGE_MODES[lod.rangeMode])
+        out.writeBool(len(lod.ranges) > 0)
+        if lod.ranges:
+            out.writeUInt(len(lod.ranges))
+            out.writeFloats([value for lod_range in lod.ranges for value in lod_range])
+
+    def serializeLightSource(self, lightsource):
+        self.writeObjectSerializer(lightsource.light)
+        self.output.writeInt(0)  # ReferenceFrame RELATIVE_RF
+
+    def serializeBone(self, bone):
+        self.writeMatrix(bone.bone_inv_bind_matrix_skeleton)
+        self.writeMatrix(None)  # MatrixInSkeletonSpace, computed by UpdateBone
+
+    def serializeDrawable(self, drawable):
+        out = self.output
+        self.writeObjectSerializer(drawable.stateset)
+        out.writeBool(drawable.initialBound is not None)
+        if drawable.initialBound is not None:
+            out.writeDoubles(drawable.initialBound[0])
+            out.writeDoubles(drawable.initialBound[1])
+        out.writeBool(False)  # ComputeBoundingBoxCallback
+        out.writeBool(False)  # Shape
+        out.writeBool(True)  # SupportsDisplayList
+        out.writeBool(True)  # UseDisplayList
+        out.writeBool(False)  # UseVertexBufferObjects
+        self.writeObjectSerializer(drawable.update_callbacks[0] if drawable.update_callbacks else None)
+        out.writeBool(False)  # EventCallback
+        out.writeBool(False)  # CullCallback
+        out.writeBool(False)  # DrawCallback
+
+    def serializeGeometry(self, geometry):
+        out = self.output
+        out.writeUInt(len(geometry.primitives))
+        for primitive in geometry.primitives:
+            self.writeDrawElements(primitive)
+
+        for data in (geometry.vertexes, geometry.normals, geometry.colors):
+            out.writeBool(bool(data))
+            if data:
+                self.writeArrayData(data)
+        out.writeBool(False)  # SecondaryColorData
+        out.writeBool(False)  # FogCoordData
+
+        out.writeBool(len(geometry.uvs) > 0)
+        if len(geometry.uvs) > 0:
+            out.writeUInt(len(geometry.uvs))
+            for uv in geometry.uvs.values():
+                self.writeArrayData(uv or TexCoordArray())
+        out.writeBool(False)  # VertexAttribData
+        out.writeBool(False)  # FastPathHint
+
+    def writeArrayData(self, data):
+        out = self.output
+        out.writeBool(data.array is not None)
+        if data.array is not None:
+            self.writeArray(data.array)
+        out.writeBool(False)  # Indices
+        out.writeInt(BIND_PER_VERTEX)
+        out.writeInt(0)  # Normalize
+
+    def writeArray(self, array_data):
+        out = self.output
+        new_id = array_data not in self.array_ids
+        if new_id:
+            self.array_ids[array_data] = len(self.array_ids) + 1
+        out.writeUInt(self.array_ids[array_data])
+        if not new_id:
+            return
+        array_type, dim = ARRAY_TYPES[array_data.type]
+        out.writeInt(array_type)
+        out.writeInt(len(array_data.array))
+        out.writeArray('f', flattenArray(array_data.array, dim))
+
+    def writeDrawElements(self, primitive):
+        out = self.output
+        element_type, typecode = ID_DRAWELEMENTS[primitive.getSizeArray()]
+        out.writeInt(element_type)
+        out.writeInt(glEnum(primitive.type))
+        out.writeInt(len(primitive.indexes))
+        indexes = primitive.indexes
+        out.writeArray(typecode, indexes.data if isinstance(indexes, IndexArray) else indexes)
+
+    def serializeRigGeometry(self, geometry):
+        out = self.output
+        out.writeBool(len(geometry.groups) > 0)
+        if len(geometry.groups) > 0:
+            out.writeUInt(len(geometry.groups))
+            for name, group in geometry.groups.items():
+                out.writeString(group.targetGroupName or "Empty")
+                out.writeUInt(len(group.vertexes))
+                for index, weight in group.vertexes:
+                    out.writeInt(index)
+                    out.writeFloat(weight)
+        self.writeObjectSerializer(geometry.sourcegeometry)
+
+    def serializeMorphGeometry(self, geometry):
+        out = self.output
+        out.writeInt(MORPH_METHODS[geometry.method])
+        out.writeBool(len(geometry.morphTargets) > 0)
+        if geometry.morphTargets:
+            out.writeUInt(len(geometry.morphTargets))
+            for target in geometry.morphTargets:
+                out.writeFloat(float(getattr(target, 'factor', 0)))
+                self.writeObject(target)
+        out.writeBool(True)  # MorphNormals
+
+    def serializeStateSet(self, stateset):
+        out = self.output
+        out.writeBool(len(stateset.modes) > 0)
+        if len(stateset.modes) > 0:
+            self.writeModes(stateset.modes)
+
+        attributes = [a for a in stateset.attributes if a is not None]
+        out.writeBool(len(attributes) > 0)
+        if attributes:
+            self.writeAttributes(attributes)
+
+        max_texture_used = stateset.getMaxTextureUnitUsed()
+        out.writeBool(len(stateset.texture_attributes) > 0)
+        if len(stateset.texture_attributes) > 0:
+            out.writeUInt(1 + max_texture_used)
+            for i in range(0, max_texture_used + 1):
+                self.writeModes({"GL_TEXTURE_2D": "ON"} if i in stateset.texture_attributes else {})
+        out.writeBool(len(stateset.texture_attributes) > 0)
+        if len(stateset.texture_attributes) > 0:
+            out.writeUInt(1 + max_texture_used)
+            for i in range(0, max_texture_used + 1):
+                self.writeAttributes([a for a in stateset.texture_attributes.get(i, []) if a is not None])
+
+        out.writeBool(False)  # UniformList
+        if stateset.modes.get("GL_BLEND") == "ON":
+            out.writeInt(TRANSPARENT_BIN)  # RenderingHint
+            out.writeInt(1)  # RenderBinMode USE_RENDERBIN_DETAILS
+            out.writeInt(10)  # BinNumber
+            out.writeString("DepthSortedBin")
+        else:
+            out.writeInt(0)
+            out.writeInt(0)  # RenderBinMode INHERIT_RENDERBIN_DETAILS
+            out.writeInt(0)
+            out.writeString("")
+        out.writeBool(True)  # NestRenderBins
+        out.writeBool(False)  # UpdateCallback
+        out.writeBool(False)  # EventCallback
+
+    def writeModes(self, modes):
+        out = self.output
+        out.writeUInt(len(modes))
+        for mode, value in modes.items():
+            out.writeUInt(glEnum(mode))
+            out.writeInt(MODE_VALUES[value])
+
+    def writeAttributes(self, attributes):
+        out = self.output
+        out.writeUInt(len(attributes))
+        for attribute in attributes:
+            self.writeObject(attribute)
+            out.writeInt(MODE_VALUES["OFF"])
+
+    def serializeStateAttribute(self, attribute):
+        self.writeObjectSerializer(attribute.update_callbacks[0] if attribute.update_callbacks else None)
+        self.output.writeBool(False)  # EventCallback
+
+    def serializeMaterial(self, material):
+        out = self.output
+        out.writeInt(MATERIAL_COLOR_MODES[material.colormode])
+        for color in (material.ambient, material.diffuse, material.specular, material.emission):
+            out.writeBool(True)
+            out.writeBool(True)  # FrontAndBack
+            out.writeFloats(color[0:4])
+            out.writeFloats(color[0:4])
+        out.writeBool(True)
+        out.writeBool(True)
+        out.writeFloat(material.shininess)
+        out.writeFloat(material.shininess)
+
+    def serializeLightModel(self, lightmodel):
+        out = self.output
+        out.writeFloats(lightmodel.ambient[0:4])
+        out.writeInt(LIGHT_COLOR_CONTROLS[lightmodel.color_control])
+        out.writeBool(lightmodel.local_viewer == "TRUE")
+        out.writeBool(False)  # TwoSided
+
+    def serializeLight(self, light):
+        out = self.output
+        out.writeInt(light.light_num)
+        out.writeFloats(light.ambient[0:4])
+        out.writeFloats(light.diffuse[0:4])
+        out.writeFloats(light.specular[0:4])
+        out.writeFloats(light.position[0:4])
+        out.writeFloats(light.direction[0:3])
+        out.writeFloat(light.constant_attenuation)
+        out.writeFloat(light.linear_attenuation)
+        out.writeFloat(light.quadratic_attenuation)
+        out.writeFloat(light.spot_exponent)
+        out.writeFloat(light.spot_cutoff)
+
+    def serializeTexture(self, texture):
+        out = self.output
+        for wrap in (texture.wrap_s, texture.wrap_t, texture.wrap_r, texture.min_filter, texture.mag_filter):
+            out.writeBool(True)
+            out.writeUInt(glEnum(wrap))
+        out.writeFloat(1.0)  # MaxAnisotropy
+        out.writeBool(True)  # UseHardwareMipMapGeneration
+        out.writeBool(False)  # UnRefImageDataAfterApply
+        out.writeBool(False)  # ClientStorageHint
+        out.writeBool(True)  # ResizeNonPowerOfTwoHint
+        out.writeDoubles((0.0, 0.0, 0.0, 0.0))  # BorderColor
+        out.writeInt(0)  # BorderWidth
+        out.writeBool(True)
+        out.writeInt(INTERNAL_FORMAT_MODES[texture.internalFormatMode])
+        out.writeBool(False)  # InternalFormat
+        out.writeUInt(0)  # SourceFormat
+        out.writeUInt(0)  # SourceType
+        out.writeBool(False)  # ShadowComparison
+        out.writeInt(GL_LEQUAL)  # ShadowCompareFunc
+        out.writeInt(GL_LUMINANCE)  # ShadowTextureMode
+        out.writeFloat(0.0)  # ShadowAmbient
+
+    def serializeTexture2D(self, texture):
+        out = self.output
+        # osg::Image is written without class name before file version 95
+        out.writeBool(True)
+        image = (texture, "image")
+        new_id = image not in self.object_ids
+        if new_id:
+            self.object_ids[image] = len(self.object_ids) + 1
+        out.writeUInt(self.object_ids[image])
+        if new_id:
+            out.writeString(texture.file)
+            out.writeInt(0)  # WriteHint NO_PREFERENCE
+            out.writeInt(IMAGE_EXTERNAL)
+            self.writeObjectFields()
+        out.writeInt(0)  # TextureWidth
+        out.writeInt(0)  # TextureHeight
+
+    def serializeDefaultUserDataContainer(self, container):
+        self.output.writeBool(False)  # UDC_UserData
+        self.output.writeBool(False)  # UDC_Descriptions
+        self.writeObjectList(container.value)
+
+    def serializeStringValueObject(self, obj):
+        self.output.writeString(obj.value)
+
+    def serializeUpdateMatrixTransform(self, callback):
+        self.writeObjectList(callback.stacked_transforms)
+
+    def serializeUpdateMorph(self, callback):
+        out = self.output
+        out.writeBool(len(callback.targetNames) > 0)
+        if callback.targetNames:
+            out.writeUInt(len(callback.targetNames))
+            for name in callback.targetNames:
+                out.writeString(name)
+
+    def serializeAnimationManagerBase(self, manager):
+        self.writeObjectList(manager.animations)
+        self.output.writeBool(True)  # AutomaticLink
+
+    def serializeAnimation(self, animation):
+        out = self.output
+        out.writeDouble(0.0)  # Duration, computed at first update
+        out.writeFloat(0.0)  # Weight
+        out.writeDouble(0.0)  # StartTime
+        out.writeInt(ANIMATION_LOOP)
+        channels = animation.channels
+        out.writeBool(len(channels) > 0)
+        if channels:
+            out.writeUInt(len(channels))
+            for channel in channels:
+                self.writeChannel(channel)
+
+    def writeChannel(self, channel):
+        out = self.output
+        typecode, dim = CHANNEL_VALUES[channel.type]
+        out.writeString(channel.type)
+        out.writeString(channel.name.strip('"'))
+        out.writeString(channel.target)
+        out.writeBool(True)  # KeyFrameContainer
+        out.writeUInt(len(channel.keys))
+        pack = struct.Struct('<d%d%s' % (dim, typecode)).pack
+        out.output.write(b"".join(pack(*key[0:dim + 1]) for key in channel.keys))
+
+    def serializeStackedTranslateElement(self, element):
+        self.output.writeFloats(element.translate[0:3])
+
+    def serializeStackedScaleElement(self, element):
+        self.output.writeFloats(element.scale[0:3])
+
+    def serializeStackedRotateAxisElement(self, element):
+        self.output.writeFloats(element.axis[0:3])
+        self.output.writeDouble(element.angle)
+
+    def serializeStackedQuaternionElement(self, element):
+        q = element.quaternion
+        self.output.writeDoubles((q.x, q.y, q.z, q.w))
+
+    def serializeStackedMatrixElement(self, element):
+        self.writeMatrix(element.matrix)
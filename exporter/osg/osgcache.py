@@ -0,0 +1,120 @@
+# -*- python-indent: 4; mode: python -*-
+# -*- coding: UTF-8 -*-
+#
+# Copyright (C) 2008-2012 Cedric Pinson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#  Cedric Pinson <cedric@plopbyte.com>
+
+# Cache of the converted geometries kept between exports. Entries are keyed by a
+# hash of the data read from blender, an unchanged mesh is not converted again.
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+# changed when the content of the entries changes, older entries are not read
+CACHE_FORMAT = 3
+CACHE_SUFFIX = ".geometry"
+
+
+def hashContent(values):
+    """
+    Hash of a sequence of buffers (arrays, bytes) and strings, nested sequences are hashed
+    in order and None is distinguished from an empty buffer
+    """
+    digest = hashlib.sha1()
+
+    def update(value):
+        if value is None:
+            digest.update(b"N")
+        elif isinstance(value, str):
+            digest.update(b"S" + str(len(value)).encode() + value.encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            digest.update(b"L" + str(len(value)).encode())
+            for item in value:
+                update(item)
+        else:
+            data = memoryview(value).cast('B')
+            digest.update(b"B" + str(len(data)).encode())
+            digest.update(data)
+
+    update([str(CACHE_FORMAT), values])
+    return digest.hexdigest()
+
+
+class GeometryCache(object):
+    """
+    Directory of cache entries, one file per key. Reading an entry touches its file so
+    evict removes the least recently used entries first.
+    """
+    def __init__(self, directory, max_size):
+        object.__init__(self)
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def contains(self, key):
+        return os.path.isfile(self.getPath(key))
+
+    def load(self, key):
+        path = self.getPath(key)
+        try:
+            with open(path, "rb") as entry:
+                value = pickle.load(entry)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # written aside then renamed so a reader never sees a partial entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as entry:
+                pickle.dump(value, entry, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.getPath(key))
+        except:
+            os.remove(temporary)
+            raise
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size bytes
+        """
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                status = os.stat(os.path.join(self.directory, name))
+                entries.append((status.st_mtime, status.st_size, name))
+        size = sum(entry_size for mtime, entry_size, name in entries)
+        for mtime, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(os.path.join(self.directory, name))
+            size -= entry_size
@@ -0,0 +1,64 @@
+# -*- python-indent: 4; mode: python -*-
+# -*- coding: UTF-8 -*-
+#
+# Copyright (C) 2008-2012 Cedric Pinson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#  Cedric Pinson <cedric@plopbyte.com>
+
+# Compressed output files, the writers write into them while serializing so
+# there is no second pass over the exported file.
+
+import gzip
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compression name -> file suffix
+COMPRESSIONS = {"none": "",
+                "gzip": ".gz",
+                "xz": ".xz",
+                "zstd": ".zst"}
+
+
+def getCompressedName(filename, compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError("unknown compression {}".format(compression))
+    return filename + COMPRESSIONS[compression]
+
+
+def openOutput(filename, compression="none", level=None):
+    """
+    Open filename for binary writing through the compressor, level None uses the codec default.
+    zstd compresses with one thread per core, gzip and xz are single threaded.
+    """
+    if compression == "none":
+        return open(filename, "wb")
+    if compression == "gzip":
+        # mtime 0 so that two exports of the same scene give the same file
+        return gzip.GzipFile(filename, "wb", compresslevel=9 if level is None else level, mtime=0)
+    if compression == "xz":
+        return lzma.open(filename, "wb", preset=level)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard module")
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level, threads=-1)
+        return compressor.stream_writer(open(filename, "wb"))
+    raise ValueError("unknown compression {}".format(compression))
@@ -48,6 +48,27 @@ class Config(object):
         self.defaultattr("indent", int(2))
         self.defaultattr("float_precision", int(5))
         self.defaultattr("format_num", int(0))
+        self.defaultattr("buffered_writer", True)
+        self.defaultattr("output_format", "osgt")
+        self.defaultattr("streaming", False)
+        self.defaultattr("compression", "none")
+        self.defaultattr("compression_level", None)
+        self.defaultattr("write_processes", 1)
+        self.defaultattr("convert_processes", 1)
+        self.defaultattr("optimize_vertex_cache", False)
+        self.defaultattr("optimize_overdraw", False)
+        self.defaultattr("overdraw_threshold", 1.05)
+        self.defaultattr("lod_levels", 0)
+        self.defaultattr("lod_ratio", 0.5)
+        self.defaultattr("lod_distance", 10.0)
+        self.defaultattr("initial_bounds", False)
+        self.defaultattr("split_geometries", False)
+        self.defaultattr("split_vertices", 65535)
+        self.defaultattr("triangulate_quads", False)
+        self.defaultattr("relative_morph_targets", False)
+        self.defaultattr("max_influences", 4)
+        self.defaultattr("cache_directory", "")
+        self.defaultattr("cache_size", 1024)
         self.defaultattr("anim_fps", 25.0)
         self.defaultattr("log", True)
         self.defaultattr("selected", "ALL")
@@ -25,19 +25,27 @@ import bpy
 import mathutils
 import json
 import math
+import multiprocessing
 import os
 import shutil
 import subprocess
 
 import osg
+from array import array
 from collections import OrderedDict
 from . import osglog
 from . import osgconf
 from .osgutils import *
 from .osgconf import DEBUG
 from . import osgbake
+from . import osgmesh
 from . import osgobject
 from .osgobject import *
+from .osgbinary import BinaryWriter
+from .osgcompress import getCompressedName, openOutput
+from .osgmesh import MaterialVertices, MeshData, VertexWeights, computeBoundingSphere, computeOverdraw, \
+    gatherMorphTarget, movesVertices, readAttribute, simplifyTriangles, triangulateQuads
+from .osgcache import GeometryCache, hashContent
 osgobject.VERSION = osg.__version__
 
 Euler = mathutils.Euler
@@ -157,6 +165,44 @@ def createAnimationMaterialAndSetCallback(osg_node, blender_object, config, uniq
     # return createAnimationsObject(osg_node, blender_object, config, UpdateMaterial(), uniq_anims)
 
 
+def readMorphTargetKeys(blender_object):
+    """
+    Names and positions of the shape keys exported as morph targets, the reference keys and
+    the keys moving no vertex of the mesh are left out. Every morph geometry of the object has
+    a target for each of these keys in this order, the weight channel of a key is named after
+    its index here.
+    """
+    keys = []
+    if hasShapeKeys(blender_object):
+        vertices = blender_object.data.vertices
+        co = readAttribute(vertices, "co", 3 * len(vertices))
+        for key in blender_object.data.shape_keys.key_blocks:
+            if key.relative_key == key:
+                continue
+            positions = readAttribute(key.data, "co", 3 * len(key.data))
+            if movesVertices(positions, co):
+                keys.append((key.name, positions))
+    return keys
+
+
+def addMorphPartChannels(animations, part_targets):
+    """
+    Copy the channels of the morph targets of the first part of split geometries to the
+    same targets of the other parts, part_targets gives the names of the copies
+    """
+    for animation in animations:
+        copies = []
+        for channel in animation.channels:
+            for target in part_targets.get(channel.target, []):
+                copy = Channel()
+                copy.setName(channel.name)
+                copy.type = channel.type
+                copy.target = target
+                copy.keys = channel.keys
+                copies.append(copy)
+        animation.channels.extend(copies)
+
+
 class UniqueObject(object):
     def __init__(self):
         self.statesets = {}
@@ -212,8 +258,14 @@ class Export(object):
         self.images = set()
         self.lights = {}
         self.root = None
+        self.stream = None
+        # ids and written elements of this export
+        self.context = SerializationContext()
         self.unique_objects = UniqueObject()
         self.parse_all_actions = False  # if only one object and several actions
+        self.geometry_cache = None
+        # converters whose geometries were converted by the pool, by object name
+        self.converters = {}
 
     def clean_generated_actions(self):
         for action in self.baked_actions:
@@ -239,6 +291,37 @@ class Export(object):
         item = self.exportChildrenRecursively(blender_object, None, None)
         if item is not None:
             self.items.append(item)
+            if self.stream is not None and self.isStreamable(item):
+                if self.config.initial_bounds:
+                    computeInitialBound(item)
+                self.stream.append(item)
+                self.releaseItemData(item)
+
+    # Skeletons and rigged meshes are kept until postProcess because
+    # reparentRiggedGeodes can move a mesh to an armature of another item
+    def isStreamable(self, item):
+        if isinstance(item, Skeleton):
+            return False
+        if isinstance(item, Geode) and getattr(item, "armature_modifier", None) is not None:
+            return False
+        return all(self.isStreamable(c) for c in getattr(item, "children", []))
+
+    # once written the geometries are only referenced by id, drop their buffers
+    def releaseItemData(self, item):
+        def releaseGeometry(geometry):
+            for data in [geometry.vertexes, geometry.normals, geometry.colors] + list(geometry.uvs.values()):
+                if data is not None and data.array is not None:
+                    data.array.array = VectorArray(data.array.array.dim)
+            for primitive in geometry.primitives:
+                primitive.indexes = IndexArray()
+            for target in getattr(geometry, "morphTargets", []):
+                releaseGeometry(target)
+
+        for drawable in getattr(item, "drawables", []):
+            if isinstance(drawable, Geometry):
+                releaseGeometry(drawable)
+        for child in getattr(item, "children", []):
+            self.releaseItemData(child)
 
     def evaluateGroup(self, blender_object, item, rootItem):
         if blender_object.dupli_group is None or len(blender_object.dupli_group.objects) == 0:
@@ -269,6 +352,57 @@ class Export(object):
     def isObjectVisible(self, blender_object):
         return blender_object.is_visible(self.config.scene) or not self.config.only_visible
 
+    def appliesModifiers(self, mesh):
+        # converting to mesh skips shape keys
+        return self.config.apply_modifiers and not hasShapeKeys(mesh) and \
+            any(mod.type != "ARMATURE" for mod in mesh.modifiers)
+
+    def getRootObjects(self):
+        # objects the export starts from, exportChildrenRecursively adds their children
+        return [obj for obj in self.config.scene.objects
+                if (self.config.selected == "SELECTED_ONLY_WITH_CHILDREN" and obj.select) or
+                (self.config.selected == "ALL" and obj.parent is None)]
+
+    def collectMeshObjects(self, blender_object, objects, visited):
+        # the mesh objects exportChildrenRecursively creates a geode for, in the same order,
+        # the objects of dupli groups are left to the traversal
+        if self.isExcluded(blender_object) or blender_object in visited:
+            return
+        visited.add(blender_object)
+        is_visible = self.isObjectVisible(blender_object)
+        if blender_object.type not in ['ARMATURE', 'LAMP', 'MESH', 'EMPTY', 'CAMERA'] or \
+           (blender_object.type == "LAMP" and not is_visible):
+            return
+        if blender_object.type == "MESH" and is_visible:
+            objects.append(blender_object)
+        for child in getChildrenOf(self.config.scene, blender_object):
+            self.collectMeshObjects(child, objects, visited)
+
+    def convertGeometries(self):
+        # The mesh data of the exported objects is read here, then the vertices of each material
+        # are converted in a pool of processes. The scene graph is built in the same order as a
+        # serial export, the converters pick up the converted vertices. Meshes of dupli groups
+        # and meshes with applied modifiers are converted during the traversal.
+        objects = []
+        visited = set()
+        for obj in self.getRootObjects():
+            self.collectMeshObjects(obj, objects, visited)
+
+        converter = ParallelGeometryConverter(self.config.convert_processes or None)
+        meshes = set()
+        for obj in objects:
+            # the first object of a mesh creates its geode, the others reuse it
+            if self.appliesModifiers(obj) or obj.data.name in meshes:
+                continue
+            meshes.add(obj.data.name)
+            self.converters[obj.name] = BlenderObjectToGeometry(object=obj,
+                                                                mesh=obj.data,
+                                                                config=self.config,
+                                                                unique_objects=self.unique_objects,
+                                                                cache=self.geometry_cache)
+            converter.add(self.converters[obj.name])
+        converter.run()
+
     def createAnimationsObject(self,
                                osg_object,
                                blender_object,
@@ -544,37 +678,55 @@ class Export(object):
         selectObjects(backup_selection)
 
     def process(self):
-        self.preProcess()
-
-        # Object.resetWriter()
-        self.scene_name = self.config.scene.name
-        Log("current scene {}".format(self.scene_name))
-        if self.config.validFilename() is False:
-            self.config.filename += self.scene_name
-        self.config.createLogfile()
+        with self.context:
+            self.preProcess()
+
+            # Object.resetWriter()
+            self.scene_name = self.config.scene.name
+            Log("current scene {}".format(self.scene_name))
+            if self.config.validFilename() is False:
+                self.config.filename += self.scene_name
+            self.config.createLogfile()
+            if self.config.cache_directory:
+                self.geometry_cache = GeometryCache(self.config.cache_directory, self.config.cache_size * 1024 * 1024)
+
+            self.setArmatureInRestMode()
+            try:
+                if self.config.object_selected is not None:
+                    o = bpy.data.objects[self.config.object_selected]
+                    try:
+                        self.config.scene.objects.active = o
+                        self.config.scene.objects.selected = [o]
+                    except ValueError:
+                        Log("Error, problem happens when assigning object {} to scene {}"
+                            .format(o.name, self.config.scene.name))
+                        raise
+
+                if self.config.streaming:
+                    if self.config.output_format == "osgt":
+                        self.root = self.createRoot()
+                        self.stream = GroupStream(self.root, buffered=self.config.buffered_writer)
+                    else:
+                        Log("streaming is only available for osgt, disable it")
 
-        self.setArmatureInRestMode()
-        try:
-            if self.config.object_selected is not None:
-                o = bpy.data.objects[self.config.object_selected]
-                try:
-                    self.config.scene.objects.active = o
-                    self.config.scene.objects.selected = [o]
-                except ValueError:
-                    Log("Error, problem happens when assigning object {} to scene {}"
-                        .format(o.name, self.config.scene.name))
-                    raise
+                if self.config.convert_processes != 1:
+                    if ParallelGeometryConverter.available():
+                        self.convertGeometries()
+                    else:
+                        Log("processes can not be forked on this platform, geometries are converted serially")
 
-            for obj in self.config.scene.objects:
-                Log("obj {}".format(obj.name))
-                if (self.config.selected == "SELECTED_ONLY_WITH_CHILDREN" and obj.select) or \
-                   (self.config.selected == "ALL" and obj.parent is None):
+                for obj in self.getRootObjects():
+                    Log("obj {}".format(obj.name))
                     self.exportItemAndChildren(obj)
-        finally:
-            self.restoreArmaturePoseMode()
-            self.clean_generated_actions()
+            finally:
+                self.converters = {}
+                self.restoreArmaturePoseMode()
+                self.clean_generated_actions()
 
-        self.postProcess()
+            self.postProcess()
+            if self.geometry_cache is not None:
+                Log("geometry cache {} hits {} misses".format(self.geometry_cache.hits, self.geometry_cache.misses))
+                self.geometry_cache.evict()
 
     # OSG requires that rig geometry be a child of the skeleton,
     # but Blender does not.  Move any meshes that are modified by
@@ -607,13 +759,20 @@ class Export(object):
             for c in list(item.children):
                 self.reparentRiggedGeodes(c, item)
 
+    def createRoot(self):
+        root = Group()
+        root.setName("Root")
+        root.getOrCreateUserData().append(StringValueObject("source", "blender"))
+        return root
+
     def postProcess(self):
         # set only one root to the scene
-        self.root = None
-        self.root = Group()
-        self.root.setName("Root")
-        self.root.children = self.items
-        self.root.getOrCreateUserData().append(StringValueObject("source", "blender"))
+        if self.stream is None:
+            self.root = self.createRoot()
+            self.root.children = self.items
+        else:
+            # streamed items are already written
+            self.root.children = [item for item in self.items if not self.stream.contains(item)]
         if len(self.animations) > 0:
             animation_manager = BasicAnimationManager()
             animation_manager.animations = self.animations
@@ -654,95 +813,131 @@ class Export(object):
                 for i in images:
                     self.images.add(i)
 
+        if self.config.initial_bounds:
+            # the streamed items got their bound before they were written
+            children = self.root.children if self.stream is None else self.stream.written + self.root.children
+            bound = computeGroupBound(computeInitialBound(child) for child in children)
+            if bound is not None and bound[1] >= 0.0:
+                self.root.initialBound = bound
+
     def write(self):
-        if len(self.items) == 0:
-            if self.config.log_file is not None:
-                self.config.closeLogfile()
-            return
+        with self.context:
+            if len(self.items) == 0:
+                if self.config.log_file is not None:
+                    self.config.closeLogfile()
+                return
+
+            output_format = self.config.output_format
+            if output_format == "osgb":
+                sfile, filename = self.openOutput("osgb")
+                Log("write file to {}".format(filename))
+                try:
+                    with sfile:
+                        BinaryWriter(sfile).writeFile(self.root)
+                except (KeyError, ValueError) as e:
+                    Log("can't write osgb ({}), fallback to osgt".format(e))
+                    os.unlink(filename)
+                    output_format = "osgt"
+
+            if output_format == "osgt":
+                sfile, filename = self.openOutput("osgt")
+                Log("write file to {}".format(filename))
+                with sfile:
+                    # sfile.write(str(self.root).encode('utf-8'))
+                    if self.stream is not None:
+                        self.stream.close(sfile)
+                    else:
+                        # 0 uses one process per core
+                        writer = GroupParallelWriter(self.root, self.config.write_processes or None)
+                        writer.writeFile(sfile, buffered=self.config.buffered_writer)
 
-        filename = self.config.getFullName("osgt")
-        Log("write file to {}".format(filename))
-        with open(filename, "wb") as sfile:
-            # sfile.write(str(self.root).encode('utf-8'))
-            self.root.writeFile(sfile)
+            nativePath = os.path.join(os.path.abspath(self.config.getFullPath()), self.config.texture_prefix)
+            # blenderPath = bpy.path.relpath(nativePath)
+            if len(self.images) > 0:
+                try:
+                    if not os.path.exists(nativePath):
+                        os.mkdir(nativePath)
+                except:
+                    Log("can't create textures directory {}".format(nativePath))
+                    raise
 
-        nativePath = os.path.join(os.path.abspath(self.config.getFullPath()), self.config.texture_prefix)
-        # blenderPath = bpy.path.relpath(nativePath)
-        if len(self.images) > 0:
-            try:
-                if not os.path.exists(nativePath):
-                    os.mkdir(nativePath)
-            except:
-                Log("can't create textures directory {}".format(nativePath))
-                raise
+            copied_images = []
+            for i in self.images:
+                if i is not None:
+                    imagename = bpy.path.basename(createImageFilename("", i))
+                    try:
+                        if i.packed_file:
+                            original_filepath = i.filepath_raw
+                            try:
+                                if len(imagename.split('.')) == 1:
+                                    imagename += ".png"
+                                filename = os.path.join(nativePath, imagename)
+                                if not os.path.exists(filename):
+                                    # record which images that were newly copied and can be safely
+                                    # cleaned up
+                                    copied_images.append(filename)
+                                i.filepath_raw = filename
+                                Log("packed file, save it to {}"
+                                    .format(os.path.abspath(bpy.path.abspath(filename))))
+                                i.save()
+                            except:
+                                Log("failed to save file {} to {}".format(imagename, nativePath))
+                            i.filepath_raw = original_filepath
+                        else:
+                            filepath = os.path.abspath(bpy.path.abspath(i.filepath))
+                            texturePath = os.path.join(nativePath, imagename)
+                            if os.path.exists(filepath):
+                                if not os.path.exists(texturePath):
+                                    # record which images that were newly copied and can be safely
+                                    # cleaned up
+                                    copied_images.append(texturePath)
+                                shutil.copy(filepath, texturePath)
+                                Log("copy file {} to {}".format(filepath, texturePath))
+                            else:
+                                Log("file {} not available".format(filepath))
+                    except Exception as e:
+                        Log("error while trying to copy file {} to {}: {}".format(imagename, nativePath, e))
+
+            filetoview = filename
+            if self.config.osgconv_to_ive:
+                if self.config.osgconv_embed_textures:
+                    r = [self.config.osgconv_path, "-O", "includeImageFileInIVEFile",
+                         filetoview, self.config.getFullName("ive")]
+                else:
+                    r = [self.config.osgconv_path, "-O", "noTexturesInIVEFile",
+                         filetoview, self.config.getFullName("ive")]
+                try:
+                    if subprocess.call(r) == 0:
+                        if self.config.osgconv_cleanup:
+                            os.unlink(filetoview)
+                            if self.config.osgconv_embed_textures:
+                                for i in copied_images:
+                                    os.unlink(i)
+                        filetoview = self.config.getFullName("ive")
+                except Exception as e:
+                    print("Error running {}".format(r))
+                    print(repr(e))
 
-        copied_images = []
-        for i in self.images:
-            if i is not None:
-                imagename = bpy.path.basename(createImageFilename("", i))
+            if self.config.run_viewer:
+                r = [self.config.viewer_path, filetoview]
                 try:
-                    if i.packed_file:
-                        original_filepath = i.filepath_raw
-                        try:
-                            if len(imagename.split('.')) == 1:
-                                imagename += ".png"
-                            filename = os.path.join(nativePath, imagename)
-                            if not os.path.exists(filename):
-                                # record which images that were newly copied and can be safely
-                                # cleaned up
-                                copied_images.append(filename)
-                            i.filepath_raw = filename
-                            Log("packed file, save it to {}"
-                                .format(os.path.abspath(bpy.path.abspath(filename))))
-                            i.save()
-                        except:
-                            Log("failed to save file {} to {}".format(imagename, nativePath))
-                        i.filepath_raw = original_filepath
-                    else:
-                        filepath = os.path.abspath(bpy.path.abspath(i.filepath))
-                        texturePath = os.path.join(nativePath, imagename)
-                        if os.path.exists(filepath):
-                            if not os.path.exists(texturePath):
-                                # record which images that were newly copied and can be safely
-                                # cleaned up
-                                copied_images.append(texturePath)
-                            shutil.copy(filepath, texturePath)
-                            Log("copy file {} to {}".format(filepath, texturePath))
-                        else:
-                            Log("file {} not available".format(filepath))
+                    subprocess.Popen(r)
                 except Exception as e:
-                    Log("error while trying to copy file {} to {}: {}".format(imagename, nativePath, e))
+                    print("Error running {}".format(r))
+                    print(repr(e))
 
-        filetoview = self.config.getFullName("osgt")
-        if self.config.osgconv_to_ive:
-            if self.config.osgconv_embed_textures:
-                r = [self.config.osgconv_path, "-O", "includeImageFileInIVEFile",
-                     self.config.getFullName("osgt"), self.config.getFullName("ive")]
-            else:
-                r = [self.config.osgconv_path, "-O", "noTexturesInIVEFile",
-                     self.config.getFullName("osgt"), self.config.getFullName("ive")]
-            try:
-                if subprocess.call(r) == 0:
-                    filetoview = self.config.getFullName("ive")
-                    if self.config.osgconv_cleanup:
-                        os.unlink(self.config.getFullName("osgt"))
-                        if self.config.osgconv_embed_textures:
-                            for i in copied_images:
-                                os.unlink(i)
-            except Exception as e:
-                print("Error running {}".format(r))
-                print(repr(e))
-
-        if self.config.run_viewer:
-            r = [self.config.viewer_path, filetoview]
-            try:
-                subprocess.Popen(r)
-            except Exception as e:
-                print("Error running {}".format(r))
-                print(repr(e))
+            if self.config.log_file is not None:
+                self.config.closeLogfile()
 
-        if self.config.log_file is not None:
-            self.config.closeLogfile()
+    def openOutput(self, extension):
+        filename = self.config.getFullName(extension)
+        compression = self.config.compression
+        try:
+            compressed_name = getCompressedName(filename, compression)
+            return openOutput(compressed_name, compression, self.config.compression_level), compressed_name
+        except ValueError as e:
+            Log("can't compress output ({}), write it uncompressed".format(e))
+            return open(filename, "wb"), filename
 
     def createGeodeFromObject(self, mesh, skeleton=None):
         Log("exporting object {}".format(mesh.name))
@@ -752,21 +947,17 @@ class Export(object):
         exportInfluence = False
 
         armature_modifier = None
-        has_non_armature_modifiers = False
 
         for mod in mesh.modifiers:
             if mod.type == "ARMATURE":
                 armature_modifier = mod
-            else:
-                has_non_armature_modifiers = True
 
         # Consider a mesh child of armature as rigged only if it has no parent_bone. To get both bone parenting
         # and riggin effect, an armature modifier has to be applied
         if armature_modifier is not None or mesh.parent and mesh.parent.type == 'ARMATURE' and not mesh.parent_bone:
             exportInfluence = True
 
-        # converting to mesh skips shape keys
-        if self.config.apply_modifiers and has_non_armature_modifiers and not hasShapeKeys(mesh):
+        if self.appliesModifiers(mesh):
             mesh_object = mesh.to_mesh(self.config.scene, True, 'PREVIEW')
         else:
             mesh_object = mesh.data
@@ -784,11 +975,15 @@ class Export(object):
                 break
 
         geometries = []
-        converter = BlenderObjectToGeometry(object=mesh,
-                                            mesh=mesh_object,
-                                            config=self.config,
-                                            unique_objects=self.unique_objects)
+        converter = self.converters.pop(mesh.name, None)
+        if converter is None:
+            converter = BlenderObjectToGeometry(object=mesh,
+                                                mesh=mesh_object,
+                                                config=self.config,
+                                                unique_objects=self.unique_objects,
+                                                cache=self.geometry_cache)
         sources_geometries = converter.convert()
+        addMorphPartChannels(self.animations, converter.morph_part_targets)
 
         Log("vertex groups {} {} ".format(exportInfluence, hasVertexGroup))
         if exportInfluence and hasVertexGroup:
@@ -808,8 +1003,9 @@ class Export(object):
         updateMorphs = {}
         # Geometries are the result of splitting Blender multi-material mesh.
         # We assume that we have as much geometries as the number of materials
-        # the original Blender mesh has. This mapping is used when renaming geometry
-        # targets in animation parsing code.
+        # the original Blender mesh has, or more when split_geometries cuts a material in
+        # parts, each with its own morph targets. This mapping is used when renaming
+        # geometry targets in animation parsing code.
         if len(geometries) > 0:
             # Rename geometries to ensure that the order is kept bewteen MorphGeometry and UpdateMorphs
             # Note: renaming geometries should not be a problem here since armature deform/animation doesn't use
@@ -847,13 +1043,92 @@ class Export(object):
                         update.addNestedCallback(callback)
 
                 geode.update_callbacks.append(update)
-        self.unique_objects.registerObject(mesh_object, geode)
-        return geode
+
+        node = geode
+        if self.config.lod_levels > 0:
+            node = self.createLOD(mesh_object.name, geode)
+        self.unique_objects.registerObject(mesh_object, node)
+        return node
+
+    def createLOD(self, name, geode):
+        """
+        Put geode under an LOD followed by lod_levels simplified copies of its geometries,
+        each level keeps lod_ratio of the triangles of the previous one. The simplified
+        geometries share the arrays and statesets of the full geometries.
+        """
+        geometries = [drawable for drawable in geode.drawables if drawable is not None]
+        if not geometries or geode.armature_modifier is not None or \
+           any(geometry.className() != "Geometry" for geometry in geometries):
+            Log("no LOD for {}, only static geometries are simplified".format(name))
+            return geode
+
+        sources = []
+        for geometry in geometries:
+            triangles = array('I')
+            for primitive in geometry.primitives:
+                indexes = primitive.indexes.data if isinstance(primitive.indexes, IndexArray) else primitive.indexes
+                if primitive.type == "GL_TRIANGLES":
+                    triangles.extend(indexes)
+                elif primitive.type == "GL_QUADS":
+                    triangles.extend(triangulateQuads(indexes, geometry.vertexes.getArray().data))
+            sources.append((geometry, triangles))
+
+        lod = LOD()
+        lod.setName("LOD{}".format(name))
+        lod.children.append(geode)
+        for level in range(1, self.config.lod_levels + 1):
+            level_geode = Geode()
+            level_geode.setName("{}_lod{}".format(name, level))
+            level_geode.armature_modifier = None
+            level_sources = []
+            for geometry, triangles in sources:
+                target = int(len(triangles) // 3 * self.config.lod_ratio)
+                simplified = simplifyTriangles(triangles, geometry.vertexes.getArray().data, target)
+                level_sources.append((geometry, simplified))
+                if len(simplified) == 0:
+                    continue
+                level_geometry = Geometry()
+                level_geometry.copyFrom(geometry)
+                level_geometry.name = "{}_lod{}".format(geometry.name, level)
+                primitive = DrawElements()
+                primitive.type = "GL_TRIANGLES"
+                primitive.indexes.extend(simplified)
+                level_geometry.primitives = [primitive]
+                level_geode.drawables.append(level_geometry)
+            before = sum(len(triangles) for geometry, triangles in sources) // 3
+            after = sum(len(triangles) for geometry, triangles in level_sources) // 3
+            if after >= before or not level_geode.drawables:
+                break
+            Log("LOD {} of {}: {} -> {} triangles".format(level, name, before, after))
+            lod.children.append(level_geode)
+            sources = level_sources
+
+        if len(lod.children) == 1:
+            return geode
+
+        # each level is used until the mesh gets lod_ratio times smaller on screen
+        positions = array('f')
+        for geometry in geometries:
+            positions.extend(geometry.vertexes.getArray().data)
+        center, radius = computeBoundingSphere(positions)
+        distance = self.config.lod_distance * radius
+        step = 1.0 / math.sqrt(self.config.lod_ratio)
+        start = 0.0
+        for level in range(len(lod.children)):
+            end = distance * step ** level if level < len(lod.children) - 1 else LOD.MAX_RANGE
+            lod.ranges.append((start, end))
+            start = end
+        return lod
 
     def createLight(self, obj):
         converter = BlenderLightToLightSource(lamp=obj)
         lightsource = converter.convert()
-        self.lights[lightsource.name] = lightsource  # will be used to index lightnum at the end
+        # light num is known now so a streamed light source is written with the right one
+        if lightsource.name in self.lights:
+            lightsource.light.light_num = self.lights[lightsource.name].light.light_num
+        else:
+            lightsource.light.light_num = len(self.lights)
+        self.lights[lightsource.name] = lightsource  # will be used to enable lights at the end
         return lightsource
 
 
@@ -947,6 +1222,17 @@ class BlenderObjectToGeometry(object):
         self.unique_objects = kwargs.get("unique_objects", UniqueObject())
         self.geom_type = Geometry
         self.mesh = kwargs.get("mesh", None)
+        # data read from blender once for all the materials, the conversion does not need bpy
+        self.mesh_data = None
+        self.shape_keys = None
+        # GeometryCache of the export, the hash of the mesh once computed
+        self.cache = kwargs.get("cache", None)
+        self.cache_content = None
+        # vertices and log messages of the materials converted by a ParallelGeometryConverter
+        self.converted = {}
+        # morph target names of the first part of split geometries and the names of the same
+        # targets in the other parts, see addMorphPartChannels
+        self.morph_part_targets = OrderedDict()
 
         # if self.config.apply_modifiers is False:
         #     self.mesh = self.object.data
@@ -1387,46 +1673,101 @@ use an uv layer '{}' that does not exist on the mesh '{}'; using the first uv ch
             for key, value in slot.items():
                 userData.append(StringValueObject(slot_name(index, key), toUserData(value)))
 
-    def parseMorphTargets(self, obj, geometry, morph_vertex_map, material_index):
-        ''' Create morph targets '''
+    def readShapeKeys(self):
+        # names and positions of the shape keys exported as morph targets
+        if self.shape_keys is None:
+            self.shape_keys = readMorphTargetKeys(self.object)
+            if hasShapeKeys(self.object):
+                exported = set(name for name, positions in self.shape_keys)
+                for key in self.object.data.shape_keys.key_blocks:
+                    if key.relative_key != key and key.name not in exported:
+                        Log("shape key {} does not move the mesh, it is skipped".format(key.name))
+        return self.shape_keys
+
+    def computeMorphTargets(self, vertices, material_index):
+        ''' Morph target positions and normals of the vertices '''
         # Absolute shape keys are converted during baking. The data is parsed
-        # in the same way for both absolute and relative keyframes
-        for key in obj.data.shape_keys.key_blocks:
-            if key.relative_key == key:
+        # in the same way for both absolute and relative keyframes. With
+        # relative_morph_targets the targets store the offsets from the geometry vertices.
+        relative = self.config.relative_morph_targets
+        keys = self.readShapeKeys()
+        targets = [gatherMorphTarget(positions, vertices.vertices, vertices.positions, relative)
+                   for name, positions in keys]
+        # normals of all the moving targets at once, with the smooth and flat faces of the geometry
+        normals = iter(vertices.computeMorphNormals([values for values in targets if values is not None], relative))
+        vertices.morph_targets = []
+        for (name, positions), values in zip(keys, targets):
+            if values is not None:
+                vertices.morph_targets.append((name, values, next(normals)))
                 continue
+            # the weights are set by index in all the geometries of the object, a key moving only
+            # other materials keeps its index here with a target equal to the geometry
+            Log("shape key {} does not move material {}, its target is unchanged".format(name, material_index))
+            if relative:
+                vertices.morph_targets.append((name, array('d', bytes(8 * len(vertices.positions))),
+                                               array('d', bytes(8 * len(vertices.normals)))))
+            else:
+                vertices.morph_targets.append((name, vertices.positions, vertices.normals))
 
+    def parseMorphTargets(self, obj, geometry, vertices, material_index, part=0):
+        ''' Create morph targets '''
+        if self.config.relative_morph_targets:
+            geometry.method = "RELATIVE"
+        keys = dict((key.name, key) for key in obj.data.shape_keys.key_blocks)
+        for name, values, normals in vertices.morph_targets:
             target = Geometry()
-            target.name = spaceSafe('{}_{}_{}'.format(obj.name, material_index, key.name))
+            target.name = spaceSafe('{}_{}_{}'.format(obj.name, material_index, name))
+            if part > 0:
+                # each part has its own targets and UpdateMorph, the animation channels of
+                # the first part are copied for them
+                first_name = target.name
+                target.name = spaceSafe('{}_{}_{}_{}'.format(obj.name, material_index, part, name))
+                self.morph_part_targets.setdefault(first_name, []).append(target.name)
 
             osg_vertexes = VertexArray()
-            for i in range(len(morph_vertex_map)):
-                osg_vertexes.getArray().append([key.data[morph_vertex_map[i]].co[0],
-                                                key.data[morph_vertex_map[i]].co[1],
-                                                key.data[morph_vertex_map[i]].co[2]])
+            osg_vertexes.getArray().extendFlat(values)
+            osg_normals = NormalArray()
+            osg_normals.getArray().extendFlat(normals)
 
             target.vertexes = osg_vertexes
-            # FIXME we don't currently generate normals, so osganimationviewer will crash
+            target.normals = osg_normals
             target.primitives = geometry.primitives
             geometry.morphTargets.append(target)
-            target.factor = key.value
+            target.factor = keys[name].value
 
-    def createGeometryForMaterialIndex(self, material_index, mesh):
-        if hasShapeKeys(self.object):
-            geom = MorphGeometry()
-        else:
-            geom = Geometry()
+    def getUVLayers(self, mesh):
+        if hasattr(mesh, "polygons"):
+            return mesh.uv_layers
+        return mesh.uv_textures
 
-        geom.groups = {}
-        if bpy.app.version[0] >= 2 and bpy.app.version[1] >= 63:
-            faces = mesh.tessfaces
-            uv_textures = mesh.tessface_uv_textures
-            vertex_colors = mesh.tessface_vertex_colors.active
+    def getInfluenceGroups(self):
+        # indexes of the vertex groups exported as influences, every named group
+        return set(index for index, vertex_group in enumerate(self.object.vertex_groups) if vertex_group.name != "")
+
+    def readMeshData(self, mesh):
+        if not hasattr(mesh, "polygons"):
+            mesh_data = MeshData.fromFaces(mesh.vertices, mesh.faces, mesh.uv_textures, mesh.vertex_colors.active)
         else:
-            faces = mesh.faces
-            uv_textures = mesh.uv_textures
-        if (len(faces) == 0):
+            # loop triangles exist since blender 2.80, before that polygons are tessellated by mathutils
+            loop_triangles = None
+            if hasattr(mesh, "calc_loop_triangles"):
+                mesh.calc_loop_triangles()
+                loop_triangles = mesh.loop_triangles
+            mesh_data = MeshData.fromPolygons(mesh.vertices, mesh.polygons, mesh.loops, mesh.uv_layers,
+                                              mesh.vertex_colors.active, loop_triangles,
+                                              mathutils.geometry.tessellate_polygon)
+        if self.object.vertex_groups:
+            # the strongest influences of each vertex, normalized like the armature modifier does
+            mesh_data.weights = VertexWeights.fromVertices(mesh.vertices, self.getInfluenceGroups(),
+                                                           self.config.max_influences)
+        return mesh_data
+
+    def createGeometriesForMaterialIndex(self, material_index, mesh, mesh_data=None):
+        if mesh_data is None:
+            mesh_data = self.readMeshData(mesh)
+        if mesh_data.face_count == 0:
             Log("object {} has no faces, so no materials".format(self.object.name))
-            return None
+            return []
         if len(mesh.materials) and mesh.materials[material_index] is not None:
             material_name = mesh.materials[material_index].name
             title = "mesh {} with material {}".format(self.object.name, material_name)
@@ -1441,114 +1782,128 @@ use an uv layer '{}' that does not exist on the mesh '{}'; using the first uv ch
            and not self.object.parent_bone:
             armature_name = '_' + str(self.object.parent.name)
 
-        collected_faces = []
-        morph_map = []
+        if len(mesh_data.getMaterialFaces(material_index)) == 0:
+            Log("object {} has no faces for sub material slot {}".format(self.object.name, material_index))
+            end_title = '-' * len(title)
+            Log(end_title)
+            return []
+
+        parts = self.readMaterialVertices(material_index, mesh_data)
+        geometries = [self.createGeometryFromVertices(material_index, mesh, mesh_data, vertices, armature_name, part)
+                      for part, vertices in enumerate(parts)]
+
+        end_title = '-' * len(title)
+        Log(end_title)
+        return geometries
+
+    def getCacheKey(self, material_index, mesh_data):
+        # hash of the data and options the converted vertices depend on
+        if self.cache_content is None:
+            config = self.config
+            options = (osgobject.VERSION, config.triangulate_quads, config.optimize_vertex_cache,
+                       config.optimize_overdraw, config.overdraw_threshold, config.split_geometries,
+                       config.split_vertices, config.relative_morph_targets, config.max_influences)
+            content = [repr(options), mesh_data.co, mesh_data.vertex_normals, mesh_data.polygon_normals,
+                       mesh_data.polygon_smooth, mesh_data.material_indices, mesh_data.loop_vertices,
+                       mesh_data.uvs, mesh_data.colors, mesh_data.face_polygons, mesh_data.face_sizes,
+                       mesh_data.face_loops]
+            if mesh_data.weights is not None:
+                content.append([mesh_data.weights.starts, mesh_data.weights.groups, mesh_data.weights.weights])
+            for name, positions in self.readShapeKeys():
+                content.append([name, positions])
+            self.cache_content = hashContent(content)
+        return hashContent([self.cache_content, str(material_index)])
+
+    def isMaterialCached(self, material_index, mesh_data):
+        return self.cache is not None and self.cache.contains(self.getCacheKey(material_index, mesh_data))
+
+    def readMaterialVertices(self, material_index, mesh_data):
+        if material_index in self.converted:
+            # converted in another process, its messages are logged where a serial export logs them
+            parts, messages = self.converted.pop(material_index)
+            for message in messages:
+                Log(message)
+        elif self.cache is None:
+            return self.convertMaterialVertices(material_index, mesh_data)
+        else:
+            # the converted vertices of an unchanged mesh are read from the cache
+            entry = self.cache.load(self.getCacheKey(material_index, mesh_data))
+            if entry is not None:
+                Log("vertices of material {} read from the cache".format(material_index))
+                return [MaterialVertices.fromAttributes(attributes) for attributes in entry]
+            parts = self.convertMaterialVertices(material_index, mesh_data)
+
+        if self.cache is not None:
+            self.cache.store(self.getCacheKey(material_index, mesh_data), [vars(part) for part in parts])
+        return parts
+
+    def convertMaterialVertices(self, material_index, mesh_data):
+        # Uvs and colors are per face and not per vertexes, face corners with the same
+        # vertex, normal, texcoords and vertex colors are merged
+        vertices = mesh_data.getMaterialVertices(material_index)
+        if self.config.triangulate_quads:
+            # one GL_TRIANGLES primitive set per geometry, GL_QUADS is not in core profiles
+            vertices.triangulateQuads()
+        if self.config.optimize_vertex_cache or self.config.optimize_overdraw:
+            # before the arrays, morph targets and vertex groups are built from the vertices
+            if self.config.optimize_vertex_cache:
+                Log("vertex cache ACMR {:.3f} -> {:.3f}".format(*vertices.optimizeVertexCache()))
+            if self.config.optimize_overdraw:
+                # the estimate rasterizes the triangles, without numpy it is too slow for large meshes
+                estimate = osgmesh.numpy is not None
+                if estimate:
+                    overdraw = computeOverdraw(vertices.triangles, vertices.positions)
+                Log("overdraw ordering ACMR {:.3f} -> {:.3f}".format(
+                    *vertices.optimizeOverdraw(self.config.overdraw_threshold)))
+                if estimate:
+                    Log("overdraw {:.3f} -> {:.3f}".format(
+                        overdraw, computeOverdraw(vertices.triangles, vertices.positions)))
+                else:
+                    Log("overdraw estimate skipped, it needs numpy")
+            vertices.reorderVertices()
+
+        parts = [vertices]
+        if self.config.split_geometries:
+            # each part is indexed with 16 bits, morph targets and vertex groups follow the parts
+            parts = vertices.split(self.config.split_vertices)
+            if len(parts) > 1:
+                Log("split {} vertices in {} geometries".format(len(vertices.vertices), len(parts)))
+
+        for part in parts:
+            if mesh_data.weights is not None:
+                part.influences = mesh_data.weights.getInfluences(part.vertices)
+            if self.readShapeKeys():
+                self.computeMorphTargets(part, material_index)
+        return parts
+
+    def createGeometryFromVertices(self, material_index, mesh, mesh_data, vertices, armature_name, part=0):
+        if hasShapeKeys(self.object):
+            geom = MorphGeometry()
+        else:
+            geom = Geometry()
+
         osg_vertexes = VertexArray()
+        osg_vertexes.getArray().extendFlat(vertices.positions)
         osg_normals = NormalArray()
+        osg_normals.getArray().extendFlat(vertices.normals)
         osg_colors = ColorArray()
-
+        if vertices.colors is not None:
+            osg_colors.getArray().extendFlat(vertices.colors)
         osg_uvs = OrderedDict()
+        for name, uv in zip(mesh_data.uv_names, vertices.uvs):
+            osg_uvs[name] = TexCoordArray()
+            osg_uvs[name].getArray().extendFlat(uv)
+
+        primitives = []
         lines = DrawElements()
         lines.type = "GL_LINES"
+        lines.indexes.extend(vertices.lines)
         triangles = DrawElements()
         triangles.type = "GL_TRIANGLES"
+        triangles.indexes.extend(vertices.triangles)
         quads = DrawElements()
         quads.type = "GL_QUADS"
-        primitives = []
-        nquad = 0
-        nlin = 0
-        ntri = 0
-        vgroups = {}
-        # index remapping
-        vertex_index_map = {}
-
-        def get_vertex_key(faceindex, facevertexindex):
-            if face.use_smooth:
-                normal = list(mesh.vertices[face.vertices[facevertexindex]].normal)
-            else:
-                normal = list(face.normal)
-
-            if vertex_colors:
-                vcolors = tuple(getattr(vertex_colors.data[faceindex], 'color{}'.format(facevertexindex + 1)))
-            else:
-                vcolors = tuple()
-
-            texcoords = [tuple(truncateVector(list(uv.data[faceindex].uv[facevertexindex])))
-                         for uv in mesh.tessface_uv_textures]
-            return (face.vertices[facevertexindex], tuple(truncateVector(normal)), tuple(texcoords), vcolors)
-
-        for face in faces:
-            if face.material_index != material_index:
-                continue
-
-            for facevertexindex, vert_index in enumerate(face.vertices):
-                # Uvs and colors are per face and not per vertexes, so need to deduplicate
-                # this here using keys.
-                # A key is build as (vertexIndex, normal, texcoords={},vertex_colors)
-                key = get_vertex_key(face.index, facevertexindex)
-                if key not in vertex_index_map:
-                    newindex = len(osg_vertexes.getArray())
-                    vertex_index_map[key] = newindex
-                    morph_map.append(vert_index)
-                    uvs = []
-
-                    for uv in mesh.tessface_uv_textures:
-                        uvs.append(uv.data[face.index].uv[facevertexindex])
-
-                    if self.object.vertex_groups:
-                        for vertex_group in mesh.vertices[vert_index].groups:
-                            influence = [self.object.vertex_groups[vertex_group.group].name, vertex_group.weight]
-                            # try:getBoneByName(influence[0])  # check bone existence
-                            if influence[0] != "" and influence[1] > 0.0001:
-                                if influence[0] not in vgroups:
-                                    vg = VertexGroup()
-                                    vg.targetGroupName = spaceSafe(influence[0] + armature_name)
-                                    vg.vertexes.append((newindex, influence[1]))
-                                    vgroups[influence[0]] = vg
-                                else:
-                                    vgroups[influence[0]].vertexes.append((newindex, vertex_group.weight))
-
-                    osg_normals.getArray().append(key[1])
-                    osg_vertexes.getArray().append(list(mesh.vertices[vert_index].co))
-                    # beware this enumerate, order can be different ?
-                    for idx, uv in enumerate(mesh.tessface_uv_textures):
-                        osg_uvs.setdefault(uv.name, TexCoordArray()).getArray().append(key[2][idx])
-
-                    if vertex_colors:
-                        col = key[len(key) - 1]
-                        osg_colors.getArray().append([col[0], col[1], col[2]])
-
-            # facelength test : crawl primitives
-            facelength = len(face.vertices)
-            if facelength == 2:
-                nlin = nlin + 1
-
-                lines.indexes.append(vertex_index_map[get_vertex_key(face.index, 0)])
-                lines.indexes.append(vertex_index_map[get_vertex_key(face.index, 1)])
-            elif facelength == 3:
-                ntri = ntri + 1
-                triangles.indexes.append(vertex_index_map[get_vertex_key(face.index, 0)])
-                triangles.indexes.append(vertex_index_map[get_vertex_key(face.index, 1)])
-                triangles.indexes.append(vertex_index_map[get_vertex_key(face.index, 2)])
-
-            elif facelength == 4:
-                nquad = nquad + 1
-                quads.indexes.append(vertex_index_map[get_vertex_key(face.index, 0)])
-                quads.indexes.append(vertex_index_map[get_vertex_key(face.index, 1)])
-                quads.indexes.append(vertex_index_map[get_vertex_key(face.index, 2)])
-                quads.indexes.append(vertex_index_map[get_vertex_key(face.index, 3)])
-
-            else:
-                osglog.log("WARNING can't manage faces with {} vertices".format(nv))
-
-            collected_faces.append(face)
-
-        if (len(collected_faces) == 0):
-            Log("object {} has no faces for sub material slot {}".format(self.object.name, material_index))
-            end_title = '-' * len(title)
-            Log(end_title)
-            return None
-
+        quads.indexes.extend(vertices.quads)
         if len(lines.indexes) != 0:
             primitives.append(lines)
         if len(triangles.indexes) != 0:
@@ -1556,6 +1911,14 @@ use an uv layer '{}' that does not exist on the mesh '{}'; using the first uv ch
         if len(quads.indexes) != 0:
             primitives.append(quads)
 
+        vgroups = OrderedDict()
+        for group in sorted(vertices.influences):
+            name = self.object.vertex_groups[group].name
+            vg = VertexGroup()
+            vg.targetGroupName = spaceSafe(name + armature_name)
+            vg.vertexes = vertices.influences[group]
+            vgroups[name] = vg
+
         geom.uvs = osg_uvs
         geom.groups = vgroups
         if mesh.vertex_colors:
@@ -1570,33 +1933,29 @@ use an uv layer '{}' that does not exist on the mesh '{}'; using the first uv ch
             geom.stateset = stateset
 
         if len(mesh.materials) > 0 and mesh.materials[material_index] is not None:
-            self.adjustUVLayerFromMaterial(geom, mesh.materials[material_index], uv_textures)
-
-        end_title = '-' * len(title)
-        Log(end_title)
+            self.adjustUVLayerFromMaterial(geom, mesh.materials[material_index], self.getUVLayers(mesh))
 
         if geom.className() == "MorphGeometry":
-            self.parseMorphTargets(self.object, geom, morph_map, material_index)
+            self.parseMorphTargets(self.object, geom, vertices, material_index, part)
 
         return geom
 
+    def getMeshData(self):
+        # read the whole mesh once for all the materials
+        if self.mesh_data is None:
+            self.mesh_data = self.readMeshData(self.mesh)
+        return self.mesh_data
+
+    def getMaterialIndexes(self, mesh):
+        # Blender has an operator to split mesh by material (bpy.ops.mesh.separate(type='MATERIAL'))
+        return range(max(len(mesh.materials), 1))
+
     def process(self, mesh):
-        if bpy.app.version[0] >= 2 and bpy.app.version[1] >= 63:
-            mesh.update(calc_tessface=True)  # Generates faces of 3 or 4 vertices
+        mesh_data = self.getMeshData()
 
         geometry_list = []
-        material_index = 0
-        if len(mesh.materials) == 0:
-            geom = self.createGeometryForMaterialIndex(0, mesh)
-            if geom is not None:
-                geometry_list.append(geom)
-        else:
-            for material in mesh.materials:
-                # Blender has an operator to split mesh by material (bpy.ops.mesh.separate(type='MATERIAL'))
-                geom = self.createGeometryForMaterialIndex(material_index, mesh)
-                if geom is not None:
-                    geometry_list.append(geom)
-                material_index += 1
+        for material_index in self.getMaterialIndexes(mesh):
+            geometry_list.extend(self.createGeometriesForMaterialIndex(material_index, mesh, mesh_data))
         return geometry_list
 
     def convert(self):
@@ -1607,6 +1966,58 @@ use an uv layer '{}' that does not exist on the mesh '{}'; using the first uv ch
         return self.process(self.mesh)
 
 
+def convertParallelVertices(index):
+    # runs in a forked process, the converters are inherited from ParallelGeometryConverter.jobs
+    converter, material_index = ParallelGeometryConverter.jobs[index]
+    osglog.CAPTURE = []
+    parts = converter.convertMaterialVertices(material_index, converter.getMeshData())
+    return [vars(part) for part in parts], osglog.CAPTURE
+
+
+class ParallelGeometryConverter(object):
+    """
+    Convert the vertices of the materials of several meshes in a pool of forked processes.
+    The mesh data and shape keys are read from blender before the pool is started, the processes
+    inherit them copy-on-write and send back the converted vertices pickled, with the messages
+    they logged. Without fork the geometries are converted serially during the traversal.
+    """
+    jobs = None
+
+    def __init__(self, processes=None):
+        object.__init__(self)
+        self.processes = processes
+        self.jobs = []
+
+    @staticmethod
+    def available():
+        return "fork" in multiprocessing.get_all_start_methods()
+
+    def add(self, converter):
+        mesh_data = converter.getMeshData()
+        if mesh_data.face_count == 0:
+            return
+        converter.readShapeKeys()
+        for material_index in converter.getMaterialIndexes(converter.mesh):
+            if len(mesh_data.getMaterialFaces(material_index)) != 0 and \
+               not converter.isMaterialCached(material_index, mesh_data):
+                self.jobs.append((converter, material_index))
+
+    def run(self):
+        # with a single job the traversal converts it, as without the pool
+        if self.processes == 1 or len(self.jobs) < 2:
+            return
+        Log("converting {} geometries in parallel".format(len(self.jobs)))
+        ParallelGeometryConverter.jobs = self.jobs
+        try:
+            with multiprocessing.get_context("fork").Pool(self.processes) as pool:
+                results = pool.imap(convertParallelVertices, range(len(self.jobs)))
+                for (converter, material_index), (entry, messages) in zip(self.jobs, results):
+                    parts = [MaterialVertices.fromAttributes(attributes) for attributes in entry]
+                    converter.converted[material_index] = (parts, messages)
+        finally:
+            ParallelGeometryConverter.jobs = None
+
+
 class BlenderAnimationToAnimation(object):
     def __init__(self, *args, **kwargs):
         self.config = kwargs["config"]
@@ -1770,12 +2181,15 @@ class BlenderAnimationToAnimation(object):
         elif morph:
             # need to create as many animation as we generate osg geometries for the object
             # (that correspond to the number of materials of the object)
+            # the weight of a key is named after its index in the exported keys, the same in all
+            # the geometries, a key without keyframes leaves its index unused
+            keys = [name for name, positions in readMorphTargetKeys(self.object)]
             for i in range(len(self.object.data.materials) if self.object.data.materials else 1):
-                self.channel_index = 0
-                for key in self.object.data.shape_keys.key_blocks:
-                    osg_target = spaceSafe('{}_{}_{}'.format(self.object.name, i, key.name))
-                    self.appendChannelsToAnimation(key.name, animation, self.current_action,
-                                                   prefix=('key_blocks["{}"].'.format(key.name)),
+                for index, name in enumerate(keys):
+                    self.channel_index = index
+                    osg_target = spaceSafe('{}_{}_{}'.format(self.object.name, i, name))
+                    self.appendChannelsToAnimation(name, animation, self.current_action,
+                                                   prefix=('key_blocks["{}"].'.format(name)),
                                                    osg_targetname=osg_target)
         else:
             self.appendChannelsToAnimation(self.target, animation, self.current_action)
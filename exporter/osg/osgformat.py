@@ -0,0 +1,85 @@
+# -*- python-indent: 4; mode: python -*-
+# -*- coding: UTF-8 -*-
+#
+# Copyright (C) 2008-2012 Cedric Pinson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#  Cedric Pinson <cedric@plopbyte.com>
+
+# Float formatting used by the osgt serializers. This module does not depend
+# on blender so it can be benchmarked outside of it.
+
+import math
+
+# values with a precomputed text, 0.0 is not there because -0.0 would match it
+# and it is written "-0.00000"
+COMMON_VALUES = (1.0, -1.0, 0.5, -0.5, 2.0, -2.0)
+# integral values from -INTEGRAL_RANGE to INTEGRAL_RANGE also have a precomputed text
+INTEGRAL_RANGE = 256
+
+
+class FloatFormat(object):
+    """
+    Format floats with a fixed precision, the format strings are built once by precision
+    """
+    formats = {}
+
+    @staticmethod
+    def get(precision):
+        float_format = FloatFormat.formats.get(precision)
+        if float_format is None:
+            float_format = FloatFormat.formats[precision] = FloatFormat(precision)
+        return float_format
+
+    def __init__(self, precision):
+        object.__init__(self)
+        self.precision = precision
+        self.format = "%%.%df" % precision
+        self.common = dict((value, self.format % value) for value in COMMON_VALUES)
+        for value in range(1, INTEGRAL_RANGE + 1):
+            self.common[float(value)] = self.format % value
+            self.common[float(-value)] = self.format % -value
+        self.zero = self.format % 0.0
+        self.negative_zero = self.format % -0.0
+        self.templates = {}
+
+    def __call__(self, value):
+        value = float(value)
+        text = self.common.get(value)
+        if text is not None:
+            return text
+        # 0.0 and -0.0 are equal but are not written the same
+        if value == 0.0:
+            return self.negative_zero if math.copysign(1.0, value) < 0.0 else self.zero
+        return self.format % value
+
+    def template(self, count, separator=" "):
+        """
+        Return a % template formatting count floats
+        """
+        key = (count, separator)
+        template = self.templates.get(key)
+        if template is None:
+            template = self.templates[key] = separator.join([self.format] * count)
+        return template
+
+    def row(self, values):
+        """
+        Format a sequence of floats separated by a space
+        """
+        values = tuple(values)
+        return self.template(len(values)) % values
@@ -18,9 +18,15 @@
 #  Cedric Pinson <cedric.pinson@plopbyte.com>
 
 LOGFILE = None
+# list collecting the messages instead of writing them, used by the processes converting geometries
+CAPTURE = None
 
 
 def log(message):
+        global CAPTURE
+        if CAPTURE is not None:
+                CAPTURE.append(message)
+                return
         print("osg:", message)
         global LOGFILE
         if LOGFILE:
@@ -0,0 +1,1310 @@
+# -*- python-indent: 4; mode: python -*-
+# -*- coding: UTF-8 -*-
+#
+# Copyright (C) 2008-2012 Cedric Pinson
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA 02111-1307, USA.
+#
+# Authors:
+#  Cedric Pinson <cedric@plopbyte.com>
+
+# Mesh data used by the geometry conversion. This module does not import
+# blender, it only uses foreach_get on the collections it is given.
+
+import heapq
+import math
+from array import array
+from collections import deque
+from itertools import chain
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# digits kept in normals and texture coordinates when vertices are compared
+KEY_DIGITS = 5
+# entries of the post transform vertex cache targeted by the index reordering
+VERTEX_CACHE_SIZE = 32
+# ACMR increase allowed when triangle clusters are reordered for overdraw
+OVERDRAW_THRESHOLD = 1.05
+# pixels on a side of the views rasterized to estimate overdraw
+OVERDRAW_RESOLUTION = 64
+# pixel fragments rasterized at once when overdraw is estimated with numpy
+OVERDRAW_BATCH_FRAGMENTS = 1 << 20
+# vertices of a geometry indexed with 16 bits, 0xffff is left for primitive restart
+MAX_SHORT_VERTICES = 65535
+# largest coordinate change of a morph target vertex still considered unchanged
+MORPH_EPSILON = 1e-6
+# face normal components computed at once for a batch of morph targets
+MORPH_BATCH_VALUES = 1 << 22
+# strongest vertex group influences kept for each vertex, 0 keeps them all
+MAX_INFLUENCES = 4
+# vertex group weights at or below this one are not influences
+MIN_INFLUENCE_WEIGHT = 0.0001
+
+
+def truncate(values, digits=KEY_DIGITS):
+    return tuple(0 if math.isnan(value) else round(value, digits) for value in values)
+
+
+def readAttribute(collection, attribute, size, typecode='f'):
+    """
+    Read an attribute of all the elements of a blender collection into a flat typed array
+    """
+    values = array(typecode, bytes(array(typecode).itemsize * size))
+    if size:
+        collection.foreach_get(attribute, values)
+    return values
+
+
+def toArray(typecode, values):
+    # numpy array to a typed array
+    return array(typecode, numpy.ascontiguousarray(values, dtype=typecode).tobytes())
+
+
+def gatherMorphTarget(key_positions, vertices, positions, relative=False, epsilon=MORPH_EPSILON):
+    """
+    Gather the flat key_positions of the mesh vertices listed in vertices, return the positions
+    or their offsets from the flat geometry positions when relative. Return None when no vertex
+    moves more than epsilon.
+    """
+    if numpy is not None:
+        indexes = numpy.frombuffer(vertices, dtype=numpy.uint32).astype(numpy.intp)
+        gathered = numpy.frombuffer(key_positions, dtype=numpy.float32).reshape(-1, 3)[indexes]
+        offsets = gathered - numpy.frombuffer(positions, dtype=numpy.float64).reshape(-1, 3)
+        if not len(offsets) or numpy.abs(offsets).max() <= epsilon:
+            return None
+        return toArray('d', offsets if relative else gathered)
+
+    gathered = array('d', chain.from_iterable(key_positions[3 * i:3 * i + 3] for i in vertices))
+    offsets = array('d', [key - base for key, base in zip(gathered, positions)])
+    if not offsets or max(abs(offset) for offset in offsets) <= epsilon:
+        return None
+    return offsets if relative else gathered
+
+
+def movesVertices(key_positions, positions, epsilon=MORPH_EPSILON):
+    """
+    True when one of the flat key_positions is more than epsilon away from the same value
+    of positions
+    """
+    if numpy is not None:
+        offsets = numpy.frombuffer(key_positions, dtype=numpy.float32).astype(numpy.float64) - \
+            numpy.frombuffer(positions, dtype=numpy.float32)
+        return bool(len(offsets)) and numpy.abs(offsets).max() > epsilon
+    return any(abs(key - value) > epsilon for key, value in zip(key_positions, positions))
+
+
+def triangulatePolygon(points, normal, tessellate=None):
+    """
+    Triangulate a polygon given by its points, return the triangles as triples of point
+    indexes with the winding of the polygon. tessellate is a function like
+    mathutils.geometry.tessellate_polygon, ear clipping is used without it.
+    """
+    # project on the plane of the largest normal component, the winding is kept
+    axis = max(range(3), key=lambda i: abs(normal[i]))
+    u, v = ((1, 2), (2, 0), (0, 1))[axis]
+    sign = 1.0 if normal[axis] >= 0 else -1.0
+    projected = [(point[u], point[v]) for point in points]
+
+    def cross(o, a, b):
+        o, a, b = projected[o], projected[a], projected[b]
+        return sign * ((a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0]))
+
+    if tessellate is not None:
+        triangles = [tuple(triangle) for triangle in tessellate([[tuple(point) for point in points]])]
+        if len(triangles) == len(points) - 2:
+            # the winding of the tessellated triangles does not follow the polygon
+            return [(a, b, c) if cross(a, b, c) >= 0.0 else (a, c, b) for a, b, c in triangles]
+
+    triangles = []
+    remaining = list(range(len(points)))
+    while len(remaining) > 3:
+        count = len(remaining)
+        for i in range(count):
+            a, b, c = remaining[i - 1], remaining[i], remaining[(i + 1) % count]
+            if cross(a, b, c) <= 0.0:
+                continue
+            if any(cross(a, b, p) >= 0.0 and cross(b, c, p) >= 0.0 and cross(c, a, p) >= 0.0
+                   for p in remaining if p not in (a, b, c)):
+                continue
+            triangles.append((a, b, c))
+            del remaining[i]
+            break
+        else:
+            # no ear in a degenerate polygon, use a fan for what is left
+            break
+    triangles.extend((remaining[0], remaining[i], remaining[i + 1]) for i in range(1, len(remaining) - 1))
+    return triangles
+
+
+class VertexCache(object):
+    """
+    FIFO post transform vertex cache simulation
+    """
+    def __init__(self, size=VERTEX_CACHE_SIZE):
+        object.__init__(self)
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.queue = deque()
+        self.cached = set()
+
+    def transform(self, indexes):
+        """
+        Add the vertices of indexes to the cache, return the number of them that were not cached
+        """
+        misses = 0
+        for index in indexes:
+            if index not in self.cached:
+                misses += 1
+                self.queue.append(index)
+                self.cached.add(index)
+                if len(self.queue) > self.size:
+                    self.cached.discard(self.queue.popleft())
+        return misses
+
+
+def computeACMR(triangles, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Average cache miss ratio: vertices transformed by triangle with a FIFO cache of cache_size
+    """
+    if len(triangles) < 3:
+        return 0.0
+    return VertexCache(cache_size).transform(triangles) / float(len(triangles) // 3)
+
+
+def optimizeVertexCache(triangles, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Reorder triangles for the post transform vertex cache with Tipsify (Sander, Nehab and
+    Barczak 2007): triangles around a fanning vertex are emitted together and the next
+    fanning vertex is the one still in the cache with the most triangles left
+    """
+    triangle_count = len(triangles) // 3
+    # triangles of each vertex
+    live = [0] * vertex_count
+    for index in triangles:
+        live[index] += 1
+    offsets = [0] * (vertex_count + 1)
+    for vertex in range(vertex_count):
+        offsets[vertex + 1] = offsets[vertex] + live[vertex]
+    fill = offsets[:]
+    adjacency = [0] * len(triangles)
+    for corner, index in enumerate(triangles):
+        adjacency[fill[index]] = corner // 3
+        fill[index] += 1
+
+    emitted = [False] * triangle_count
+    timestamps = [0] * vertex_count
+    dead_ends = []
+    time = cache_size + 1
+    cursor = 0
+    result = array('I')
+    fanning = 0 if triangle_count else -1
+    while fanning >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            for index in triangles[3 * triangle:3 * triangle + 3]:
+                result.append(index)
+                dead_ends.append(index)
+                candidates.append(index)
+                live[index] -= 1
+                if time - timestamps[index] > cache_size:
+                    timestamps[index] = time
+                    time += 1
+
+        # the candidate that stays in the cache while its triangles are emitted
+        fanning = -1
+        best = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if time - timestamps[vertex] + 2 * live[vertex] <= cache_size:
+                    priority = time - timestamps[vertex]
+                if priority > best:
+                    best = priority
+                    fanning = vertex
+        if fanning < 0:
+            while dead_ends:
+                vertex = dead_ends.pop()
+                if live[vertex] > 0:
+                    fanning = vertex
+                    break
+        if fanning < 0:
+            while cursor < vertex_count:
+                if live[cursor] > 0:
+                    fanning = cursor
+                    break
+                cursor += 1
+    return result
+
+
+def computeOverdraw(triangles, positions, resolution=OVERDRAW_RESOLUTION):
+    """
+    Fragments shaded by covered pixel when the triangles are drawn in order with a depth test and
+    back face culling, over the six axis aligned orthographic views of their bounding box.
+    1.0 means no overdraw
+    """
+    if numpy is None:
+        return computeOverdrawLoop(triangles, positions, resolution)
+
+    faces = numpy.asarray(triangles, dtype=numpy.intp)
+    faces = faces[:len(faces) - len(faces) % 3].reshape(-1, 3)
+    points = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 3)
+    if not len(faces):
+        return 0.0
+    used = points[numpy.unique(faces)]
+    low = used.min(axis=0)
+    high = used.max(axis=0)
+    shaded = 0
+    covered = 0
+    for depth_axis, u_axis, v_axis in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        scale_u = resolution / (high[u_axis] - low[u_axis]) if high[u_axis] > low[u_axis] else 0.0
+        scale_v = resolution / (high[v_axis] - low[v_axis]) if high[v_axis] > low[v_axis] else 0.0
+        x = (points[faces, u_axis] - low[u_axis]) * scale_u
+        y = (points[faces, v_axis] - low[v_axis]) * scale_v
+        z = points[faces, depth_axis]
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (y[:, 1] - y[:, 0]) * (x[:, 2] - x[:, 0])
+        drawn = area != 0.0
+        x, y, z, area = x[drawn], y[drawn], z[drawn], area[drawn]
+        # pixel centers inside the bounding box of each triangle
+        min_x = numpy.maximum(numpy.ceil(x.min(axis=1) - 0.5), 0).astype(numpy.intp)
+        max_x = numpy.minimum(numpy.floor(x.max(axis=1) - 0.5), resolution - 1).astype(numpy.intp)
+        min_y = numpy.maximum(numpy.ceil(y.min(axis=1) - 0.5), 0).astype(numpy.intp)
+        max_y = numpy.minimum(numpy.floor(y.max(axis=1) - 0.5), resolution - 1).astype(numpy.intp)
+        widths = numpy.maximum(max_x - min_x + 1, 0)
+        counts = widths * numpy.maximum(max_y - min_y + 1, 0)
+        ends = numpy.cumsum(counts)
+
+        # depth buffers of the views looking up the axis and down the axis, the farthest depths
+        # are stored negated so both views keep the smallest value
+        buffers = [numpy.full(resolution * resolution, numpy.inf), numpy.full(resolution * resolution, numpy.inf)]
+        start = 0
+        while start < len(counts):
+            first = ends[start] - counts[start]
+            end = max(int(numpy.searchsorted(ends, first + OVERDRAW_BATCH_FRAGMENTS, side="right")), start + 1)
+            # the fragments of the triangles from start to end, in drawing order
+            fragments = numpy.repeat(numpy.arange(start, end), counts[start:end])
+            offsets = numpy.arange(len(fragments)) - (ends[fragments] - counts[fragments] - first)
+            pixel_x = min_x[fragments] + offsets % numpy.maximum(widths[fragments], 1)
+            pixel_y = min_y[fragments] + offsets // numpy.maximum(widths[fragments], 1)
+            center_x = pixel_x + 0.5
+            center_y = pixel_y + 0.5
+            (x0, x1, x2), (y0, y1, y2), (z0, z1, z2) = (values[fragments].T for values in (x, y, z))
+            w0 = ((x2 - x1) * (center_y - y1) - (y2 - y1) * (center_x - x1)) / area[fragments]
+            w1 = ((x0 - x2) * (center_y - y2) - (y0 - y2) * (center_x - x2)) / area[fragments]
+            w2 = 1.0 - w0 - w1
+            inside = (w0 >= 0.0) & (w1 >= 0.0) & (w2 >= 0.0)
+            depth = w0 * z0 + w1 * z1 + w2 * z2
+            pixels = pixel_y * resolution + pixel_x
+            back = area[fragments] < 0.0
+            shaded += depthTest(buffers[0], pixels[inside & back], depth[inside & back])
+            shaded += depthTest(buffers[1], pixels[inside & ~back], -depth[inside & ~back])
+            start = end
+        covered += sum(int(numpy.count_nonzero(buffer != numpy.inf)) for buffer in buffers)
+    if covered == 0:
+        return 0.0
+    return shaded / float(covered)
+
+
+def depthTest(buffer, pixels, depths):
+    """
+    Draw fragments given in order with a less depth test, return the number of fragments
+    written. The first entry of each pixel is its depth in the buffer, a fragment is written
+    when it is below all the entries before it for that pixel, compared by rank to be exact.
+    """
+    if not len(pixels):
+        return 0
+    touched = numpy.unique(pixels)
+    entries = numpy.concatenate([touched, pixels])
+    values = numpy.concatenate([buffer[touched], depths])
+    order = numpy.argsort(entries, kind="stable")
+    written = order >= len(touched)
+    groups = numpy.searchsorted(touched, entries[order])
+    ranks = numpy.unique(values[order], return_inverse=True)[1].ravel()
+    # the keys of a pixel are all below the keys of the pixels before it
+    keys = ranks.astype(numpy.int64) - groups.astype(numpy.int64) * (len(ranks) + 1)
+    lowest = numpy.minimum.accumulate(keys)
+    count = int(numpy.count_nonzero(written[1:] & (keys[1:] < lowest[:-1])))
+    starts = numpy.searchsorted(groups, numpy.arange(len(touched)))
+    buffer[touched] = numpy.minimum.reduceat(values[order], starts)
+    return count
+
+
+def computeOverdrawLoop(triangles, positions, resolution):
+    # computeOverdraw without numpy
+    used = sorted(set(triangles))
+    if not used:
+        return 0.0
+    low = [min(positions[3 * index + axis] for index in used) for axis in range(3)]
+    high = [max(positions[3 * index + axis] for index in used) for axis in range(3)]
+    shaded = 0
+    covered = 0
+    for depth_axis, u_axis, v_axis in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+        scale_u = resolution / (high[u_axis] - low[u_axis]) if high[u_axis] > low[u_axis] else 0.0
+        scale_v = resolution / (high[v_axis] - low[v_axis]) if high[v_axis] > low[v_axis] else 0.0
+        # depth buffers of the views looking up the axis and down the axis, a triangle is only
+        # drawn in the view it faces
+        nearest = [float("inf")] * (resolution * resolution)
+        farthest = [float("-inf")] * (resolution * resolution)
+        for corner in range(0, len(triangles) - 2, 3):
+            points = []
+            for index in triangles[corner:corner + 3]:
+                points.append(((positions[3 * index + u_axis] - low[u_axis]) * scale_u,
+                               (positions[3 * index + v_axis] - low[v_axis]) * scale_v,
+                               positions[3 * index + depth_axis]))
+            (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = points
+            area = (x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)
+            if area == 0.0:
+                continue
+            # pixel centers inside the bounding box of the triangle
+            min_x = max(int(math.ceil(min(x0, x1, x2) - 0.5)), 0)
+            max_x = min(int(math.floor(max(x0, x1, x2) - 0.5)), resolution - 1)
+            min_y = max(int(math.ceil(min(y0, y1, y2) - 0.5)), 0)
+            max_y = min(int(math.floor(max(y0, y1, y2) - 0.5)), resolution - 1)
+            for y in range(min_y, max_y + 1):
+                center_y = y + 0.5
+                for x in range(min_x, max_x + 1):
+                    center_x = x + 0.5
+                    w0 = ((x2 - x1) * (center_y - y1) - (y2 - y1) * (center_x - x1)) / area
+                    w1 = ((x0 - x2) * (center_y - y2) - (y0 - y2) * (center_x - x2)) / area
+                    w2 = 1.0 - w0 - w1
+                    if w0 < 0.0 or w1 < 0.0 or w2 < 0.0:
+                        continue
+                    z = w0 * z0 + w1 * z1 + w2 * z2
+                    pixel = y * resolution + x
+                    if area < 0.0:
+                        if z < nearest[pixel]:
+                            nearest[pixel] = z
+                            shaded += 1
+                    elif z > farthest[pixel]:
+                        farthest[pixel] = z
+                        shaded += 1
+        covered += sum(1 for z in nearest if z != float("inf"))
+        covered += sum(1 for z in farthest if z != float("-inf"))
+    if covered == 0:
+        return 0.0
+    return shaded / float(covered)
+
+
+def splitClusters(triangles, cache_size=VERTEX_CACHE_SIZE, threshold=OVERDRAW_THRESHOLD):
+    """
+    First triangle of each cluster of triangles that can be moved around without losing more
+    than threshold on the ACMR. Clusters start where the three vertices of a triangle miss the
+    cache, and are split again each time the ACMR since the last split gets under threshold
+    times the ACMR of the cluster, the cache is flushed at each split.
+    """
+    triangle_count = len(triangles) // 3
+    cache = VertexCache(cache_size)
+    misses = [cache.transform(triangles[3 * triangle:3 * triangle + 3]) for triangle in range(triangle_count)]
+    hard = [triangle for triangle in range(triangle_count) if triangle == 0 or misses[triangle] == 3]
+
+    clusters = []
+    for start, end in zip(hard, hard[1:] + [triangle_count]):
+        cache.reset()
+        target = threshold * cache.transform(triangles[3 * start:3 * end]) / float(end - start)
+        clusters.append(start)
+        cache.reset()
+        running_misses = 0
+        running_triangles = 0
+        for triangle in range(start, end - 1):
+            running_misses += cache.transform(triangles[3 * triangle:3 * triangle + 3])
+            running_triangles += 1
+            if running_misses <= target * running_triangles:
+                clusters.append(triangle + 1)
+                cache.reset()
+                running_misses = 0
+                running_triangles = 0
+    return clusters
+
+
+def optimizeOverdraw(triangles, positions, cache_size=VERTEX_CACHE_SIZE, threshold=OVERDRAW_THRESHOLD):
+    """
+    Reorder clusters of triangles so the ones facing away from the center of the mesh are drawn
+    first and hide the ones behind them (Sander, Nehab and Barczak 2007). The triangles should
+    already be optimized for the vertex cache, the clusters keep their own order.
+    """
+    triangle_count = len(triangles) // 3
+    if triangle_count == 0:
+        return array('I', triangles)
+
+    def position(index):
+        return positions[3 * index:3 * index + 3]
+
+    mesh_center = [sum(positions[3 * index + axis] for index in triangles) / len(triangles) for axis in range(3)]
+    clusters = splitClusters(triangles, cache_size, threshold)
+    keys = []
+    for start, end in zip(clusters, clusters[1:] + [triangle_count]):
+        # area weighted center and normal of the cluster
+        center = [0.0, 0.0, 0.0]
+        normal = [0.0, 0.0, 0.0]
+        cluster_area = 0.0
+        for corner in range(3 * start, 3 * end, 3):
+            p0, p1, p2 = [position(index) for index in triangles[corner:corner + 3]]
+            e1 = [p1[axis] - p0[axis] for axis in range(3)]
+            e2 = [p2[axis] - p0[axis] for axis in range(3)]
+            cross = [e1[1] * e2[2] - e1[2] * e2[1], e1[2] * e2[0] - e1[0] * e2[2], e1[0] * e2[1] - e1[1] * e2[0]]
+            area = math.sqrt(sum(value * value for value in cross))
+            for axis in range(3):
+                center[axis] += (p0[axis] + p1[axis] + p2[axis]) / 3.0 * area
+                normal[axis] += cross[axis]
+            cluster_area += area
+        if cluster_area > 0.0:
+            center = [value / cluster_area for value in center]
+        length = math.sqrt(sum(value * value for value in normal))
+        if length > 0.0:
+            normal = [value / length for value in normal]
+        keys.append(sum((center[axis] - mesh_center[axis]) * normal[axis] for axis in range(3)))
+
+    result = array('I')
+    bounds = clusters + [triangle_count]
+    for cluster in sorted(range(len(clusters)), key=lambda cluster: -keys[cluster]):
+        result.extend(triangles[3 * bounds[cluster]:3 * bounds[cluster + 1]])
+    return result
+
+
+def triangulateQuads(quads, positions=None):
+    """
+    Split GL_QUADS indexes in two triangles each, along the shortest diagonal when the flat
+    positions are given, the winding of the quads is kept
+    """
+    def distance(first, second):
+        return sum((positions[3 * first + axis] - positions[3 * second + axis]) ** 2 for axis in range(3))
+
+    triangles = array('I')
+    for corner in range(0, len(quads) - 3, 4):
+        a, b, c, d = quads[corner:corner + 4]
+        if positions is not None and distance(b, d) < distance(a, c):
+            triangles.extend((a, b, d, b, c, d))
+        else:
+            triangles.extend((a, b, c, a, c, d))
+    return triangles
+
+
+def computeBoundingSphere(positions):
+    """
+    Center of the bounding box of the flat positions and the distance to the farthest one
+    """
+    if len(positions) < 3:
+        return (0.0, 0.0, 0.0), 0.0
+    center = tuple((min(positions[axis::3]) + max(positions[axis::3])) * 0.5 for axis in range(3))
+    radius = 0.0
+    for index in range(0, len(positions) - 2, 3):
+        x = positions[index] - center[0]
+        y = positions[index + 1] - center[1]
+        z = positions[index + 2] - center[2]
+        radius = max(radius, x * x + y * y + z * z)
+    return center, math.sqrt(radius)
+
+
+def quadricError(quadric, position):
+    """
+    Squared distance of position to the planes summed in quadric
+    """
+    a2, ab, ac, ad, b2, bc, bd, c2, cd, d2 = quadric
+    x, y, z = position
+    error = a2 * x * x + b2 * y * y + c2 * z * z + d2 + \
+        2.0 * (ab * x * y + ac * x * z + bc * y * z + ad * x + bd * y + cd * z)
+    return abs(error)
+
+
+def simplifyTriangles(triangles, positions, target_count):
+    """
+    Collapse edges by increasing quadric error (Garland and Heckbert 1997) until about
+    target_count triangles are left. A vertex is only collapsed onto one of its neighbors so
+    the vertices are unchanged and the result indexes the same vertex arrays. Vertices sharing
+    their position with another one (uv seams and other attribute boundaries) and vertices on
+    the border of the mesh are never moved, those boundaries are kept as they are.
+    The collapses wait in a heap, after a collapse the vertices around it get new entries and
+    their old ones are skipped when they come out.
+    """
+    triangles = array('I', triangles)
+    vertex_count = len(positions) // 3
+
+    def position(index):
+        return positions[3 * index:3 * index + 3]
+
+    # vertices at the same position share the first one as position id
+    first = {}
+    position_ids = [first.setdefault(tuple(position(index)), index) for index in range(vertex_count)]
+    wedges = [0] * vertex_count
+    for index in position_ids:
+        wedges[index] += 1
+
+    edges = {}
+    quadrics = {}
+    for corner in range(0, len(triangles) - 2, 3):
+        ids = [position_ids[index] for index in triangles[corner:corner + 3]]
+        for k in range(3):
+            edge = (min(ids[k], ids[k - 1]), max(ids[k], ids[k - 1]))
+            edges[edge] = edges.get(edge, 0) + 1
+        p0, p1, p2 = [position(index) for index in triangles[corner:corner + 3]]
+        e1 = [p1[axis] - p0[axis] for axis in range(3)]
+        e2 = [p2[axis] - p0[axis] for axis in range(3)]
+        normal = [e1[1] * e2[2] - e1[2] * e2[1], e1[2] * e2[0] - e1[0] * e2[2], e1[0] * e2[1] - e1[1] * e2[0]]
+        length = math.sqrt(sum(value * value for value in normal))
+        for index in ids:
+            quadrics.setdefault(index, [0.0] * 10)
+        if length == 0.0:
+            continue
+        a, b, c = [value / length for value in normal]
+        d = -(a * p0[0] + b * p0[1] + c * p0[2])
+        # weighted by the triangle area
+        weight = length * 0.5
+        plane = [weight * value for value in (a * a, a * b, a * c, a * d, b * b, b * c, b * d, c * c, c * d, d * d)]
+        for index in set(ids):
+            quadric = quadrics[index]
+            for k in range(10):
+                quadric[k] += plane[k]
+
+    # open and non manifold edges lock their vertices
+    locked = bytearray(vertex_count)
+    for (a, b), count in edges.items():
+        if count != 2:
+            locked[a] = locked[b] = 1
+    for index in range(vertex_count):
+        if wedges[position_ids[index]] > 1 or locked[position_ids[index]]:
+            locked[index] = 1
+
+    def flips(source, target, corners):
+        # true if moving source onto target turns one of its triangles by more than ~75 degrees
+        moved = position(target)
+        for corner in corners:
+            indexes = triangles[corner:corner + 3]
+            if target in indexes or indexes[0] == indexes[1] or indexes[1] == indexes[2] or indexes[0] == indexes[2]:
+                continue
+            points = [position(index) for index in indexes]
+            normals = []
+            for p0, p1, p2 in (points, [moved if index == source else points[k] for k, index in enumerate(indexes)]):
+                e1 = [p1[axis] - p0[axis] for axis in range(3)]
+                e2 = [p2[axis] - p0[axis] for axis in range(3)]
+                normals.append([e1[1] * e2[2] - e1[2] * e2[1], e1[2] * e2[0] - e1[0] * e2[2],
+                                e1[0] * e2[1] - e1[1] * e2[0]])
+            before, after = normals
+            dot = sum(before[axis] * after[axis] for axis in range(3))
+            if dot <= 0.25 * math.sqrt(sum(v * v for v in before) * sum(v * v for v in after)):
+                return True
+        return False
+
+    # triangles of each vertex, updated by the collapses
+    vertex_corners = [set() for index in range(vertex_count)]
+    for corner in range(0, len(triangles) - 2, 3):
+        for index in triangles[corner:corner + 3]:
+            vertex_corners[index].add(corner)
+
+    def neighbors(index):
+        result = set(other for corner in vertex_corners[index] for other in triangles[corner:corner + 3])
+        result.discard(index)
+        return result
+
+    def collapses(source):
+        # collapses of source onto its neighbors by increasing error
+        quadric = quadrics[position_ids[source]]
+        return sorted((quadricError(quadric, position(target)), target) for target in neighbors(source))
+
+    # collapses by increasing error, an entry is dropped when the version of its vertex changed.
+    # The flips are checked when an entry comes out, most entries never do.
+    versions = [0] * vertex_count
+    heap = []
+
+    def push(source):
+        versions[source] += 1
+        if locked[source] or not vertex_corners[source]:
+            return
+        quadric = quadrics[position_ids[source]]
+        targets = neighbors(source)
+        if targets:
+            error, target = min((quadricError(quadric, position(target)), target) for target in targets)
+            heapq.heappush(heap, (error, source, versions[source], target))
+
+    for index in range(vertex_count):
+        push(index)
+
+    triangle_count = len(triangles) // 3
+    removed = bytearray(triangle_count)
+    while triangle_count > target_count and heap:
+        error, source, version, target = heapq.heappop(heap)
+        if version != versions[source]:
+            continue
+        if flips(source, target, vertex_corners[source]):
+            # the next collapse of source which does not flip, it is checked again when it
+            # comes out but nothing changed around source until then
+            for error, target in collapses(source):
+                if not flips(source, target, vertex_corners[source]):
+                    heapq.heappush(heap, (error, source, version, target))
+                    break
+            continue
+        ring = set()
+        for corner in list(vertex_corners[source]):
+            indexes = triangles[corner:corner + 3]
+            ring.update(indexes)
+            if target in indexes:
+                # the triangle is degenerate once source is on target
+                removed[corner // 3] = 1
+                triangle_count -= 1
+                for index in indexes:
+                    vertex_corners[index].discard(corner)
+            else:
+                for k in range(corner, corner + 3):
+                    if triangles[k] == source:
+                        triangles[k] = target
+                vertex_corners[target].add(corner)
+        vertex_corners[source].clear()
+        target_quadric = quadrics[position_ids[target]]
+        for k, value in enumerate(quadrics[position_ids[source]]):
+            target_quadric[k] += value
+        # the neighborhood of the ring changed, the old entries of its vertices are stale
+        for index in ring:
+            push(index)
+
+    triangles = array('I', chain.from_iterable(triangles[corner:corner + 3]
+                                               for corner in range(0, len(triangles) - 2, 3)
+                                               if not removed[corner // 3]))
+    return triangles
+
+
+class MeshData(object):
+    """
+    Flat copies of the mesh attributes read with one foreach_get per attribute instead
+    of one RNA access per element. Floats keep the single precision of blender so values
+    are the same as the ones read from RNA.
+    Faces are the lines, triangles and quads exported, each one has its polygon and the loops
+    of its corners in 4 slots. Polygons with more than 4 vertices are triangulated.
+    """
+    def __init__(self, vertices):
+        object.__init__(self)
+        self.vertex_count = len(vertices)
+        self.co = readAttribute(vertices, "co", 3 * self.vertex_count)
+        self.vertex_normals = readAttribute(vertices, "normal", 3 * self.vertex_count)
+        # VertexWeights of the vertex groups, read separately since they are not RNA arrays
+        self.weights = None
+
+        # by polygon
+        self.polygon_normals = array('f')
+        self.polygon_smooth = array('b')
+        self.material_indices = array('h')
+
+        # by loop
+        self.loop_vertices = array('I')
+        self.uv_names = []
+        self.uvs = []
+        self.colors = None
+
+        # by face
+        self.face_count = 0
+        self.face_polygons = array('I')
+        self.face_sizes = array('B')
+        self.face_loops = array('I')
+        self.material_faces = None
+
+    @staticmethod
+    def fromPolygons(vertices, polygons, loops, uv_layers, vertex_colors=None, loop_triangles=None,
+                     tessellate=None):
+        """
+        Read a mesh from its polygons and loops, loop_triangles are used for the polygons
+        with more than 4 vertices when they are available, or else the tessellate function
+        """
+        data = MeshData(vertices)
+        polygon_count = len(polygons)
+        loop_count = len(loops)
+        data.polygon_normals = readAttribute(polygons, "normal", 3 * polygon_count)
+        data.polygon_smooth = readAttribute(polygons, "use_smooth", polygon_count, 'b')
+        data.material_indices = readAttribute(polygons, "material_index", polygon_count, 'h')
+        starts = readAttribute(polygons, "loop_start", polygon_count, 'I')
+        sizes = readAttribute(polygons, "loop_total", polygon_count, 'I')
+
+        data.loop_vertices = readAttribute(loops, "vertex_index", loop_count, 'I')
+        data.uv_names = [uv.name for uv in uv_layers]
+        data.uvs = [readAttribute(uv.data, "uv", 2 * loop_count) for uv in uv_layers]
+        if vertex_colors:
+            # colors have an alpha since blender 2.80, it is not exported
+            components = len(vertex_colors.data[0].color) if loop_count else 3
+            data.colors = readAttribute(vertex_colors.data, "color", components * loop_count)
+            if components == 4:
+                del data.colors[3::4]
+
+        data.setPolygons(starts, sizes, loop_triangles, tessellate)
+        return data
+
+    @staticmethod
+    def fromFaces(vertices, faces, uv_layers, vertex_colors=None):
+        """
+        Read a mesh made of faces of 3 or 4 vertices (blender before 2.63),
+        the loops of a face are its 4 vertex slots
+        """
+        data = MeshData(vertices)
+        face_count = len(faces)
+        data.polygon_normals = readAttribute(faces, "normal", 3 * face_count)
+        data.polygon_smooth = readAttribute(faces, "use_smooth", face_count, 'b')
+        data.material_indices = readAttribute(faces, "material_index", face_count, 'h')
+        data.loop_vertices = readAttribute(faces, "vertices_raw", 4 * face_count, 'I')
+        data.uv_names = [uv.name for uv in uv_layers]
+        data.uvs = [readAttribute(uv.data, "uv_raw", 8 * face_count) for uv in uv_layers]
+        if vertex_colors:
+            data.colors = array('f', bytes(array('f').itemsize * 12 * face_count))
+            for corner in range(4):
+                color = readAttribute(vertex_colors.data, "color{}".format(corner + 1), 3 * face_count)
+                for component in range(3):
+                    data.colors[3 * corner + component::12] = color[component::3]
+
+        data.face_count = face_count
+        data.face_polygons = array('I', range(face_count))
+        # blender never stores 0 as the fourth index of a quad, it is the triangle marker
+        data.face_sizes = array('B', [4 if index else 3 for index in data.loop_vertices[3::4]])
+        data.face_loops = array('I', range(4 * face_count))
+        return data
+
+    def setPolygons(self, starts, sizes, loop_triangles=None, tessellate=None):
+        """
+        Make the faces from the polygons, lines, triangles and quads are kept and the
+        triangles of the larger polygons are added after them
+        """
+        if numpy is not None:
+            starts = numpy.frombuffer(starts, dtype=numpy.uint32).astype(numpy.intp)
+            sizes = numpy.frombuffer(sizes, dtype=numpy.uint32).astype(numpy.intp)
+            polygons = numpy.nonzero((sizes >= 2) & (sizes <= 4))[0]
+            loops = starts[polygons, None] + numpy.arange(4)
+            loops[numpy.arange(4) >= sizes[polygons, None]] = 0
+            self.face_polygons = toArray('I', polygons)
+            self.face_sizes = toArray('B', sizes[polygons])
+            self.face_loops = toArray('I', loops)
+            ngons = numpy.nonzero(sizes > 4)[0].tolist()
+        else:
+            ngons = []
+            for polygon, (start, size) in enumerate(zip(starts, sizes)):
+                if 2 <= size <= 4:
+                    self.addFace(polygon, range(start, start + size))
+                elif size > 4:
+                    ngons.append(polygon)
+
+        if ngons:
+            self.addPolygonTriangles(ngons, starts, sizes, loop_triangles, tessellate)
+        self.face_count = len(self.face_polygons)
+
+    def addPolygonTriangles(self, polygons, starts, sizes, loop_triangles=None, tessellate=None):
+        if loop_triangles is not None:
+            count = len(loop_triangles)
+            triangle_polygons = readAttribute(loop_triangles, "polygon_index", count, 'I')
+            triangle_loops = readAttribute(loop_triangles, "loops", 3 * count, 'I')
+            polygons = set(polygons)
+            for triangle, polygon in enumerate(triangle_polygons):
+                if polygon in polygons:
+                    self.addFace(polygon, triangle_loops[3 * triangle:3 * triangle + 3])
+            return
+
+        co = self.co
+        loop_vertices = self.loop_vertices
+        for polygon in polygons:
+            start = int(starts[polygon])
+            loops = range(start, start + int(sizes[polygon]))
+            points = [co[3 * loop_vertices[loop]:3 * loop_vertices[loop] + 3] for loop in loops]
+            normal = self.polygon_normals[3 * polygon:3 * polygon + 3]
+            for triangle in triangulatePolygon(points, normal, tessellate):
+                self.addFace(polygon, [loops[corner] for corner in triangle])
+
+    def addFace(self, polygon, loops):
+        self.face_polygons.append(polygon)
+        self.face_sizes.append(len(loops))
+        self.face_loops.extend(loops)
+        self.face_loops.extend([0] * (4 - len(loops)))
+
+    def getMaterialFaces(self, material_index):
+        """
+        Return the faces using material_index, all the faces are bucketed by material in one pass
+        """
+        if self.material_faces is None:
+            self.material_faces = {}
+            material_indices = self.material_indices
+            for face, polygon in enumerate(self.face_polygons):
+                index = material_indices[polygon]
+                faces = self.material_faces.get(index)
+                if faces is None:
+                    faces = self.material_faces[index] = array('I')
+                faces.append(face)
+        return self.material_faces.get(material_index, array('I'))
+
+    def getMaterialVertices(self, material_index):
+        """
+        Merge the corners of the faces using material_index into vertices
+        """
+        faces = self.getMaterialFaces(material_index)
+        if numpy is not None:
+            return MaterialVertices.fromArrays(self, faces)
+        return MaterialVertices.fromKeys(self, faces)
+
+
+class MaterialVertices(object):
+    """
+    Vertices of the faces using one material. Face corners with the same vertex, normal,
+    texture coordinates and color become one vertex, normals and texture coordinates are
+    compared and stored truncated to KEY_DIGITS. Vertices are numbered by first use.
+    """
+    def __init__(self):
+        object.__init__(self)
+        # mesh vertex of each vertex
+        self.vertices = array('I')
+        self.positions = array('d')
+        self.normals = array('d')
+        # 1 for the vertices of smooth faces which use the vertex normal
+        self.smooth = array('B')
+        self.uvs = []
+        self.colors = None
+        # indexes by face size
+        self.lines = array('I')
+        self.triangles = array('I')
+        self.quads = array('I')
+        # filled by the exporter: vertex group influences, like VertexWeights.getInfluences,
+        # and (shape key name, positions, normals) of the morph targets
+        self.influences = {}
+        self.morph_targets = []
+
+    def triangulateQuads(self):
+        """
+        Move the quads to the triangles, split along their shortest diagonal
+        """
+        self.triangles.extend(triangulateQuads(self.quads, self.positions))
+        self.quads = array('I')
+
+    def optimizeVertexCache(self, cache_size=VERTEX_CACHE_SIZE):
+        """
+        Reorder the triangles for the vertex cache, return the ACMR of the triangles before and
+        after. reorderVertices should be called once the triangles are in their final order.
+        """
+        before = computeACMR(self.triangles, cache_size)
+        self.triangles = optimizeVertexCache(self.triangles, len(self.vertices), cache_size)
+        return before, computeACMR(self.triangles, cache_size)
+
+    def optimizeOverdraw(self, threshold=OVERDRAW_THRESHOLD, cache_size=VERTEX_CACHE_SIZE):
+        """
+        Reorder the clusters of triangles to reduce overdraw, return the ACMR of the triangles
+        before and after. computeOverdraw rasterizes the triangles, it is not called here.
+        """
+        acmr = computeACMR(self.triangles, cache_size)
+        self.triangles = optimizeOverdraw(self.triangles, self.positions, cache_size, threshold)
+        return acmr, computeACMR(self.triangles, cache_size)
+
+    def reorderVertices(self):
+        """
+        Number the vertices in the order the primitives use them so vertex fetches are sequential
+        """
+        count = len(self.vertices)
+        remap = [-1] * count
+        order = []
+        for index in chain(self.lines, self.triangles, self.quads):
+            if remap[index] < 0:
+                remap[index] = len(order)
+                order.append(index)
+        for index in range(count):
+            if remap[index] < 0:
+                remap[index] = len(order)
+                order.append(index)
+
+        self.gatherVertices(self, order)
+        self.lines = array('I', [remap[index] for index in self.lines])
+        self.triangles = array('I', [remap[index] for index in self.triangles])
+        self.quads = array('I', [remap[index] for index in self.quads])
+
+    def gatherVertices(self, source, order):
+        """
+        Set the vertices to the vertices of source listed in order
+        """
+        def gather(values, dim):
+            if numpy is not None:
+                dtype = numpy.dtype(values.typecode)
+                return toArray(values.typecode, numpy.frombuffer(values, dtype=dtype).reshape(-1, dim)[order])
+            return array(values.typecode, chain.from_iterable(values[dim * i:dim * i + dim] for i in order))
+
+        self.vertices = gather(source.vertices, 1)
+        self.positions = gather(source.positions, 3)
+        self.normals = gather(source.normals, 3)
+        self.smooth = gather(source.smooth, 1)
+        self.uvs = [gather(uv, 2) for uv in source.uvs]
+        self.colors = None
+        if source.colors is not None:
+            self.colors = gather(source.colors, 3)
+
+    def computeMorphNormals(self, targets, relative=False):
+        """
+        Normals of the morph targets given as flat positions, or offsets from the vertex positions
+        when relative. The face normals are weighted by area and summed on the mesh vertex for
+        smooth vertices and on the vertex itself for flat ones. Normals are offsets from the
+        vertex normals when relative.
+        """
+        triangles = list(self.triangles) + list(triangulateQuads(self.quads))
+        if numpy is None:
+            return [self.computeMorphNormalsLoop(target, triangles, relative) for target in targets]
+
+        count = len(self.vertices)
+        base = numpy.frombuffer(self.positions, dtype=numpy.float64).reshape(-1, 3)
+        base_normals = numpy.frombuffer(self.normals, dtype=numpy.float64).reshape(-1, 3)
+        faces = numpy.array(triangles, dtype=numpy.intp).reshape(-1, 3)
+        mesh_vertices, shared = numpy.unique(numpy.frombuffer(self.vertices, dtype=numpy.uint32),
+                                             return_inverse=True)
+        shared = shared.ravel()
+        smooth = numpy.frombuffer(self.smooth, dtype=numpy.uint8) != 0
+        # sums of the flat vertices come after the sums of the mesh vertices
+        groups = numpy.where(smooth, shared, len(mesh_vertices) + numpy.arange(count))
+        corner_groups = numpy.concatenate([groups[faces].ravel(), shared[faces[smooth[faces] == 0]]])
+        corner_faces = numpy.concatenate([numpy.repeat(numpy.arange(len(faces)), 3),
+                                          numpy.nonzero(smooth[faces] == 0)[0]])
+
+        result = []
+        batch = max(1, MORPH_BATCH_VALUES // max(1, 3 * len(faces)))
+        for start in range(0, len(targets), batch):
+            positions = numpy.stack([numpy.frombuffer(target, dtype=numpy.float64).reshape(-1, 3)
+                                     for target in targets[start:start + batch]])
+            if relative:
+                positions = positions + base
+            # components first so the gathers below read contiguous rows
+            x, y, z = numpy.ascontiguousarray(positions.transpose(2, 0, 1))
+            ux, uy, uz = (values[:, faces[:, 1]] - values[:, faces[:, 0]] for values in (x, y, z))
+            vx, vy, vz = (values[:, faces[:, 2]] - values[:, faces[:, 0]] for values in (x, y, z))
+            face_normals = (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+            # one bincount per component and target sums the face normals of all the corners
+            sums = numpy.array([[numpy.bincount(corner_groups, weights=values[corner_faces],
+                                                minlength=len(mesh_vertices) + count) for values in component]
+                                for component in face_normals])
+            normals = sums[:, :, groups].transpose(1, 2, 0)
+            lengths = numpy.sqrt((normals ** 2).sum(axis=2))[:, :, None]
+            normals = numpy.where(lengths > 0, normals / numpy.maximum(lengths, 1e-30), base_normals)
+            if relative:
+                normals = normals - base_normals
+            result.extend(toArray('d', normal) for normal in normals)
+        return result
+
+    def computeMorphNormalsLoop(self, target, triangles, relative):
+        # computeMorphNormals without numpy, one target at a time
+        count = len(self.vertices)
+        positions = target
+        if relative:
+            positions = [offset + value for offset, value in zip(target, self.positions)]
+        sums = {}
+        for corner in range(0, len(triangles), 3):
+            a, b, c = (positions[3 * index:3 * index + 3] for index in triangles[corner:corner + 3])
+            u = [b[axis] - a[axis] for axis in range(3)]
+            v = [c[axis] - a[axis] for axis in range(3)]
+            normal = (u[1] * v[2] - u[2] * v[1], u[2] * v[0] - u[0] * v[2], u[0] * v[1] - u[1] * v[0])
+            for index in triangles[corner:corner + 3]:
+                # smooth vertices sum on the mesh vertex, all the faces count for it
+                keys = [('mesh', self.vertices[index])]
+                if not self.smooth[index]:
+                    keys.append(('flat', index))
+                for key in keys:
+                    total = sums.setdefault(key, [0.0, 0.0, 0.0])
+                    for axis in range(3):
+                        total[axis] += normal[axis]
+
+        result = array('d')
+        for index in range(count):
+            base_normal = self.normals[3 * index:3 * index + 3]
+            key = ('mesh', self.vertices[index]) if self.smooth[index] else ('flat', index)
+            normal = sums.get(key, (0.0, 0.0, 0.0))
+            length = math.sqrt(sum(value * value for value in normal))
+            normal = [value / length for value in normal] if length > 0 else list(base_normal)
+            if relative:
+                normal = [value - base for value, base in zip(normal, base_normal)]
+            result.extend(normal)
+        return result
+
+    def split(self, max_vertices=MAX_SHORT_VERTICES):
+        """
+        Split the faces in parts using at most max_vertices vertices each. A part grows from a
+        face to the faces sharing its vertices so parts stay compact, the faces of a part keep
+        their order and its vertices are numbered by first use.
+        """
+        if len(self.vertices) <= max_vertices:
+            return [self]
+        faces = [self.lines[i:i + 2] for i in range(0, len(self.lines), 2)] + \
+            [self.triangles[i:i + 3] for i in range(0, len(self.triangles), 3)] + \
+            [self.quads[i:i + 4] for i in range(0, len(self.quads), 4)]
+        vertex_faces = [[] for i in range(len(self.vertices))]
+        for face, indexes in enumerate(faces):
+            for index in indexes:
+                vertex_faces[index].append(face)
+
+        assigned = bytearray(len(faces))
+        parts = []
+        seed = 0
+        while True:
+            while seed < len(faces) and assigned[seed]:
+                seed += 1
+            if seed == len(faces):
+                break
+            used = set()
+            part = []
+            queue = deque([seed])
+            cursor = seed + 1
+            while queue:
+                face = queue.popleft()
+                if not assigned[face]:
+                    new = set(faces[face]) - used
+                    if not part or len(used) + len(new) <= max_vertices:
+                        assigned[face] = 1
+                        part.append(face)
+                        used.update(new)
+                        for index in new:
+                            queue.extend(vertex_faces[index])
+                if not queue:
+                    # the next faces in order when a piece of the mesh is done
+                    while cursor < len(faces) and assigned[cursor]:
+                        cursor += 1
+                    if cursor < len(faces):
+                        queue.append(cursor)
+                        cursor += 1
+            parts.append(sorted(part))
+
+        result = []
+        for part in parts:
+            vertices = MaterialVertices()
+            remap = [-1] * len(self.vertices)
+            order = []
+            for face in part:
+                indexes = faces[face]
+                for index in indexes:
+                    if remap[index] < 0:
+                        remap[index] = len(order)
+                        order.append(index)
+                primitive = vertices.getPrimitive(len(indexes))
+                primitive.extend(remap[index] for index in indexes)
+            vertices.gatherVertices(self, order)
+            result.append(vertices)
+        return result
+
+    def getPrimitive(self, size):
+        # indexes of the faces with size vertices
+        return (self.lines, self.triangles, self.quads)[size - 2]
+
+    @staticmethod
+    def fromAttributes(attributes):
+        """
+        Vertices from the attributes of other vertices, vars(vertices) gives them as plain
+        arrays and containers which can be pickled
+        """
+        result = MaterialVertices()
+        result.__dict__.update(attributes)
+        return result
+
+    @staticmethod
+    def fromKeys(mesh_data, faces):
+        """
+        Merge corners with a dictionary of keys, used when numpy is not available
+        """
+        result = MaterialVertices()
+        result.uvs = [array('d') for uv in mesh_data.uvs]
+        if mesh_data.colors:
+            result.colors = array('d')
+        face_loops = mesh_data.face_loops
+        face_polygons = mesh_data.face_polygons
+        loop_vertices = mesh_data.loop_vertices
+        vertex_normals = mesh_data.vertex_normals
+        polygon_normals = mesh_data.polygon_normals
+        polygon_smooth = mesh_data.polygon_smooth
+        uvs = mesh_data.uvs
+        colors = mesh_data.colors
+        vertex_index_map = {}
+
+        for face in faces:
+            indexes = result.getPrimitive(mesh_data.face_sizes[face])
+            polygon = face_polygons[face]
+            for corner in range(mesh_data.face_sizes[face]):
+                loop = face_loops[4 * face + corner]
+                vertex = loop_vertices[loop]
+                if polygon_smooth[polygon]:
+                    normal = truncate(vertex_normals[3 * vertex:3 * vertex + 3])
+                else:
+                    normal = truncate(polygon_normals[3 * polygon:3 * polygon + 3])
+                texcoords = tuple(truncate(uv[2 * loop:2 * loop + 2]) for uv in uvs)
+                color = tuple(colors[3 * loop:3 * loop + 3]) if colors else ()
+
+                key = (vertex, normal, texcoords, color)
+                index = vertex_index_map.get(key)
+                if index is None:
+                    index = vertex_index_map[key] = len(result.vertices)
+                    result.vertices.append(vertex)
+                    result.positions.extend(mesh_data.co[3 * vertex:3 * vertex + 3].tolist())
+                    result.normals.extend(normal)
+                    result.smooth.append(1 if polygon_smooth[polygon] else 0)
+                    for texcoord, values in zip(texcoords, result.uvs):
+                        values.extend(texcoord)
+                    if colors:
+                        result.colors.extend(color)
+                indexes.append(index)
+        return result
+
+    @staticmethod
+    def fromArrays(mesh_data, faces):
+        """
+        Merge corners with numpy: the corner keys are rows of one array, numpy.unique
+        gives the first corner of each vertex and the vertex of each corner
+        """
+        result = MaterialVertices()
+        faces = numpy.frombuffer(faces, dtype=numpy.uint32).astype(numpy.intp)
+        sizes = numpy.frombuffer(mesh_data.face_sizes, dtype=numpy.uint8)[faces].astype(numpy.intp)
+        corner_faces = numpy.repeat(faces, sizes)
+        corner_sizes = numpy.repeat(sizes, sizes)
+        starts = numpy.cumsum(sizes) - sizes
+        corners = numpy.arange(len(corner_faces)) - numpy.repeat(starts, sizes)
+
+        face_loops = numpy.frombuffer(mesh_data.face_loops, dtype=numpy.uint32).reshape(-1, 4)
+        loops = face_loops[corner_faces, corners].astype(numpy.intp)
+        polygons = numpy.frombuffer(mesh_data.face_polygons, dtype=numpy.uint32)[corner_faces].astype(numpy.intp)
+        vertices = numpy.frombuffer(mesh_data.loop_vertices, dtype=numpy.uint32)[loops].astype(numpy.intp)
+        smooth = numpy.frombuffer(mesh_data.polygon_smooth, dtype=numpy.int8)[polygons] != 0
+        vertex_normals = numpy.frombuffer(mesh_data.vertex_normals, dtype=numpy.float32).reshape(-1, 3)
+        polygon_normals = numpy.frombuffer(mesh_data.polygon_normals, dtype=numpy.float32).reshape(-1, 3)
+        normals = numpy.where(smooth[:, None], vertex_normals[vertices], polygon_normals[polygons])
+
+        def truncateArray(values):
+            # exact like round(): float32 values times 10^5 fit in a double
+            values = numpy.round(values.astype(numpy.float64), KEY_DIGITS)
+            values[numpy.isnan(values)] = 0.0
+            return values
+
+        columns = [vertices[:, None].astype(numpy.float64), truncateArray(normals)]
+        for uv in mesh_data.uvs:
+            uv = numpy.frombuffer(uv, dtype=numpy.float32).reshape(-1, 2)
+            columns.append(truncateArray(uv[loops]))
+        if mesh_data.colors:
+            colors = numpy.frombuffer(mesh_data.colors, dtype=numpy.float32).reshape(-1, 3)
+            columns.append(colors[loops].astype(numpy.float64))
+        keys = numpy.hstack(columns)
+
+        # adding 0.0 turns -0.0 into 0.0, they are the same key like in a dictionary
+        rows = numpy.ascontiguousarray(keys + 0.0)
+        rows = rows.view(numpy.dtype((numpy.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+        unused, first, inverse = numpy.unique(rows, return_index=True, return_inverse=True)
+        order = numpy.argsort(first, kind='stable')
+        rank = numpy.empty(len(order), dtype=numpy.intp)
+        rank[order] = numpy.arange(len(order))
+        indexes = rank[inverse.ravel()].astype(numpy.uint32)
+        first = first[order]
+
+        result.vertices = toArray('I', vertices[first])
+        co = numpy.frombuffer(mesh_data.co, dtype=numpy.float32).reshape(-1, 3)
+        result.positions = toArray('d', co[vertices[first]])
+        result.normals = toArray('d', columns[1][first])
+        result.smooth = toArray('B', smooth[first])
+        result.uvs = [toArray('d', uv[first]) for uv in columns[2:2 + len(mesh_data.uvs)]]
+        if mesh_data.colors:
+            result.colors = toArray('d', columns[-1][first])
+        result.lines = toArray('I', indexes[corner_sizes == 2])
+        result.triangles = toArray('I', indexes[corner_sizes == 3])
+        result.quads = toArray('I', indexes[corner_sizes == 4])
+        return result
+
+
+class VertexWeights(object):
+    """
+    Vertex group weights of the mesh vertices stored like a sparse matrix, the influences of
+    vertex i are the groups[starts[i]:starts[i + 1]] with the same weights
+    """
+    def __init__(self):
+        object.__init__(self)
+        self.starts = array('I', [0])
+        self.groups = array('I')
+        self.weights = array('d')
+
+    @staticmethod
+    def fromVertices(vertices, groups, max_influences=MAX_INFLUENCES):
+        """
+        Read the weights of blender vertices in one pass, only the vertex groups whose index
+        is in groups are influences
+        """
+        vertex_indexes = array('I')
+        group_indexes = array('I')
+        weights = array('d')
+        # the weights are a collection on each vertex and not an array of the mesh, foreach_get
+        # can not read them at once
+        for index, vertex in enumerate(vertices):
+            for vertex_group in vertex.groups:
+                if vertex_group.weight > MIN_INFLUENCE_WEIGHT and vertex_group.group in groups:
+                    vertex_indexes.append(index)
+                    group_indexes.append(vertex_group.group)
+                    weights.append(vertex_group.weight)
+        return VertexWeights.fromArrays(len(vertices), vertex_indexes, group_indexes, weights, max_influences)
+
+    @staticmethod
+    def fromArrays(vertex_count, vertex_indexes, groups, weights, max_influences=MAX_INFLUENCES):
+        """
+        Keep the max_influences strongest weights of each vertex and scale them to a sum of 1,
+        the weights are given by vertex in increasing order
+        """
+        result = VertexWeights()
+        if numpy is None:
+            influences = [[] for index in range(vertex_count)]
+            for index, group, weight in zip(vertex_indexes, groups, weights):
+                influences[index].append((group, weight))
+            for vertex in influences:
+                vertex.sort(key=lambda influence: -influence[1])
+                if max_influences:
+                    del vertex[max_influences:]
+                total = sum(weight for group, weight in vertex)
+                result.groups.extend(group for group, weight in vertex)
+                result.weights.extend(weight / total for group, weight in vertex)
+                result.starts.append(len(result.groups))
+            return result
+
+        vertex_indexes = numpy.frombuffer(vertex_indexes, dtype=numpy.uint32).astype(numpy.intp)
+        groups = numpy.frombuffer(groups, dtype=numpy.uint32)
+        weights = numpy.frombuffer(weights, dtype=numpy.float64)
+        # by vertex then by decreasing weight, the order of the groups is kept for equal weights
+        order = numpy.lexsort((-weights, vertex_indexes))
+        vertex_indexes, groups, weights = vertex_indexes[order], groups[order], weights[order]
+        counts = numpy.bincount(vertex_indexes, minlength=vertex_count)
+        if max_influences:
+            ranks = numpy.arange(len(vertex_indexes)) - (numpy.cumsum(counts) - counts)[vertex_indexes]
+            keep = ranks < max_influences
+            vertex_indexes, groups, weights = vertex_indexes[keep], groups[keep], weights[keep]
+            counts = numpy.bincount(vertex_indexes, minlength=vertex_count)
+        totals = numpy.bincount(vertex_indexes, weights=weights, minlength=vertex_count)
+        result.starts = toArray('I', numpy.concatenate([[0], numpy.cumsum(counts)]))
+        result.groups = toArray('I', groups)
+        result.weights = toArray('d', weights / totals[vertex_indexes])
+        return result
+
+    def getInfluences(self, vertices):
+        """
+        Influences of the mesh vertices listed in vertices, as a dictionary of the group
+        indexes to the lists of (index in vertices, weight) sorted by index
+        """
+        result = {}
+        if numpy is None:
+            for index, vertex in enumerate(vertices):
+                for entry in range(self.starts[vertex], self.starts[vertex + 1]):
+                    result.setdefault(self.groups[entry], []).append((index, self.weights[entry]))
+            return result
+
+        vertices = numpy.frombuffer(vertices, dtype=numpy.uint32).astype(numpy.intp)
+        starts = numpy.frombuffer(self.starts, dtype=numpy.uint32).astype(numpy.intp)
+        counts = starts[vertices + 1] - starts[vertices]
+        indexes = numpy.repeat(numpy.arange(len(vertices)), counts)
+        # the entries of each vertex follow the start of the vertex
+        entries = numpy.arange(counts.sum()) + numpy.repeat(starts[vertices] - (numpy.cumsum(counts) - counts),
+                                                            counts)
+        if not len(entries):
+            return result
+        groups = numpy.frombuffer(self.groups, dtype=numpy.uint32)[entries]
+        weights = numpy.frombuffer(self.weights, dtype=numpy.float64)[entries]
+        order = numpy.argsort(groups, kind='stable')
+        groups, indexes, weights = groups[order], indexes[order], weights[order]
+        bounds = numpy.flatnonzero(numpy.diff(groups)) + 1
+        for group, group_indexes, group_weights in zip(groups[numpy.concatenate([[0], bounds])].tolist(),
+                                                       numpy.split(indexes, bounds), numpy.split(weights, bounds)):
+            result[group] = list(zip(group_indexes.tolist(), group_weights.tolist()))
+        return result
@@ -21,17 +21,136 @@
 
 
 import bpy
+import io
 import json
+import math
 import mathutils
+import multiprocessing
+import re
+import shutil
+import tempfile
+import threading
+from array import array
 from collections import OrderedDict
+from itertools import chain
+from .osgformat import FloatFormat
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 Matrix = mathutils.Matrix
 Vector = mathutils.Vector
 FLOATPRE = 5
 CONCAT = lambda s, j="": j.join(str(v) for v in s)
-STRFLT = lambda f: "%%.%df" % FLOATPRE % float(f)
+STRFLT = lambda f: FloatFormat.get(FLOATPRE)(f)
 INDENT = 2
 VERSION = (0, 0, 0)
+# number of array elements formatted per write
+ARRAY_CHUNK = 4096
+ARRAY_DIMS = {"FloatArray": 1, "Vec2fArray": 2, "Vec3fArray": 3, "Vec4fArray": 4}
+
+
+def flattenArray(values, dim):
+    """
+    Return the first dim components of each element of values as a flat list of float
+    """
+    if isinstance(values, VectorArray) and values.dim == dim:
+        return values.data
+    if numpy is not None and isinstance(values, numpy.ndarray) and values.ndim == 2:
+        return values[:, 0:dim].astype(numpy.float64).ravel().tolist()
+    flat = list(chain.from_iterable(values))
+    if len(flat) != dim * len(values):
+        flat = list(chain.from_iterable(v[0:dim] for v in values))
+    return flat
+
+
+class VectorArray(object):
+    """
+    Vectors of dim components stored in a single typed buffer, it can be used like a list
+    of tuples. Values are stored as float like in the osg arrays, the writers format the
+    buffer directly.
+    """
+    def __init__(self, dim, values=None, typecode='f'):
+        object.__init__(self)
+        self.dim = dim
+        self.data = array(typecode)
+        if values is not None:
+            self.extend(values)
+
+    def append(self, value):
+        if len(value) != self.dim:
+            raise ValueError("expected {} components, got {}".format(self.dim, len(value)))
+        self.extendData(value)
+
+    def extendData(self, values):
+        # array.extend only takes arrays of the same type
+        if isinstance(values, array) and values.typecode != self.data.typecode:
+            values = values.tolist()
+        self.data.extend(values)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def extendFlat(self, values):
+        """
+        Append components from a flat sequence, its length must be a multiple of dim
+        """
+        size = len(self.data)
+        self.extendData(values)
+        if len(self.data) % self.dim:
+            del self.data[size:]
+            raise ValueError("flat data length is not a multiple of {}".format(self.dim))
+
+    def __len__(self):
+        return len(self.data) // self.dim
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("VectorArray index out of range")
+        return tuple(self.data[index * self.dim:(index + 1) * self.dim])
+
+    def __iter__(self):
+        data = self.data
+        dim = self.dim
+        for i in range(0, len(data), dim):
+            yield tuple(data[i:i + dim])
+
+
+class IndexArray(object):
+    """
+    Primitive indexes stored in a typed buffer, the maximum index is kept up to date
+    so the DrawElements type is known without scanning the indexes
+    """
+    def __init__(self, values=None):
+        object.__init__(self)
+        self.data = array('I')
+        self.max_index = 0
+        if values is not None:
+            self.extend(values)
+
+    def append(self, index):
+        self.data.append(index)
+        if index > self.max_index:
+            self.max_index = index
+
+    def extend(self, values):
+        size = len(self.data)
+        self.data.extend(values)
+        if len(self.data) > size:
+            self.max_index = max(self.max_index, max(self.data[size:]))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __iter__(self):
+        return iter(self.data)
 
 
 def findNode(name, root):
@@ -64,72 +183,279 @@ def findMaterial(name, root):
     return None
 
 
+def expandBoundingSphere(sphere, point):
+    # osg::BoundingSphere::expandBy(Vec3), the center moves toward point
+    center, radius = sphere
+    if radius < 0.0:
+        return tuple(point), 0.0
+    delta = [point[i] - center[i] for i in range(3)]
+    distance = math.sqrt(sum(d * d for d in delta))
+    if distance <= radius:
+        return sphere
+    grow = (distance - radius) * 0.5
+    return tuple(center[i] + delta[i] * grow / distance for i in range(3)), radius + grow
+
+
+def computeGroupBound(spheres):
+    """
+    Bounding sphere of children spheres like osg::Group::computeBound, None if one of them
+    is None. A negative radius is an empty bound.
+    """
+    spheres = list(spheres)
+    if any(sphere is None for sphere in spheres):
+        return None
+    spheres = [sphere for sphere in spheres if sphere[1] >= 0.0]
+    if not spheres:
+        return (0.0, 0.0, 0.0), -1.0
+    center = tuple((min(c[i] for c, r in spheres) + max(c[i] for c, r in spheres)) * 0.5 for i in range(3))
+    radius = max(math.sqrt(sum((c[i] - center[i]) ** 2 for i in range(3))) + r for c, r in spheres)
+    return center, radius
+
+
+def computeInitialBound(node):
+    """
+    Set the InitialBound of node, of the nodes under it and of their geometries the way osg
+    computes their bounds, and return the bounding sphere of node as (center, radius), the
+    radius is negative for an empty node. Nodes that are animated or deformed at runtime and
+    the nodes above them get no bound and None is returned.
+    """
+    if getattr(node, "initialBound", None) is not None:
+        return node.initialBound
+    if isinstance(node, (Skeleton, Bone)) or \
+       any(not isinstance(callback, AnimationManagerBase) for callback in node.update_callbacks):
+        return None
+
+    if isinstance(node, Geode):
+        low = [float("inf")] * 3
+        high = [float("-inf")] * 3
+        for drawable in node.drawables:
+            if drawable is None:
+                continue
+            if drawable.className() != "Geometry" or drawable.update_callbacks:
+                return None
+            if drawable.initialBound is None and drawable.vertexes and len(drawable.vertexes.getArray()):
+                data = drawable.vertexes.getArray().data
+                drawable.initialBound = (tuple(min(data[i::3]) for i in range(3)),
+                                         tuple(max(data[i::3]) for i in range(3)))
+            if drawable.initialBound is not None:
+                low = [min(low[i], drawable.initialBound[0][i]) for i in range(3)]
+                high = [max(high[i], drawable.initialBound[1][i]) for i in range(3)]
+        if low[0] > high[0]:
+            return (0.0, 0.0, 0.0), -1.0
+        # the sphere around the box, half its diagonal
+        sphere = (tuple((low[i] + high[i]) * 0.5 for i in range(3)),
+                  math.sqrt(sum((high[i] - low[i]) ** 2 for i in range(3))) * 0.5)
+    else:
+        sphere = computeGroupBound(computeInitialBound(child) for child in getattr(node, "children", []))
+        if sphere is None:
+            return None
+        if isinstance(node, LightSource) and node.light is not None and node.light.position[3] != 0.0:
+            position = node.light.position
+            sphere = expandBoundingSphere(sphere, [position[i] / position[3] for i in range(3)])
+        if isinstance(node, MatrixTransform) and sphere[1] >= 0.0:
+            matrix = node.matrix
+            center, radius = sphere
+            center = tuple(sum(matrix[r][c] * center[c] for c in range(3)) + matrix[r][3] for r in range(3))
+            # the largest scale of the matrix axes
+            scale = max(math.sqrt(sum(matrix[r][c] ** 2 for r in range(3))) for c in range(3))
+            sphere = center, radius * scale
+
+    if sphere[1] >= 0.0:
+        node.initialBound = sphere
+    return sphere
+
+
+class IndentTable(dict):
+    """
+    Indent prefixes per indent_level, built once for a given INDENT
+    """
+    def __init__(self, indent):
+        dict.__init__(self)
+        self.indent = indent
+
+    def __missing__(self, level):
+        prefix = " " * (self.indent * level)
+        self[level] = prefix
+        return prefix
+
+
+class BufferedOutput(object):
+    """
+    Writer backend that collects serialized text in large chunks and
+    encodes/flushes them to the underlying binary stream once per chunk
+    """
+    def __init__(self, output, chunk_lines=65536):
+        object.__init__(self)
+        self.output = output
+        self.chunk_lines = chunk_lines
+        self.chunks = []
+
+    def write(self, text):
+        chunks = self.chunks
+        chunks.append(text)
+        if len(chunks) >= self.chunk_lines:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.output.write("".join(self.chunks).encode('utf-8'))
+            self.chunks = []
+
+
+class SerializationContext(object):
+    """
+    State of one export: unique ids allocation and the elements already written.
+    Objects created or written in a thread use the context activated in this thread
+    with a with statement, or a default one reset by Writer.resetWriter.
+    """
+    local = threading.local()
+
+    def __init__(self):
+        object.__init__(self)
+        self.object_id = 0
+        self.array_id = 0
+        self.instances = 0
+        self.wrote_elements = {}
+        # None when the output backend takes text and encodes it itself
+        self.encoding = 'utf-8'
+        # when a list, (id, start, end, reference) of each object written in full
+        self.spans = None
+        self.previous = []
+
+    @staticmethod
+    def current():
+        context = getattr(SerializationContext.local, "context", None)
+        if context is None:
+            context = SerializationContext.local.context = SerializationContext()
+        return context
+
+    @staticmethod
+    def reset():
+        SerializationContext.local.context = SerializationContext()
+
+    def __enter__(self):
+        self.previous.append(getattr(SerializationContext.local, "context", None))
+        SerializationContext.local.context = self
+        return self
+
+    def __exit__(self, *args):
+        SerializationContext.local.context = self.previous.pop()
+
+    def newObjectID(self):
+        self.object_id += 1
+        return self.object_id - 1
+
+    def newArrayID(self):
+        self.array_id += 1
+        return self.array_id - 1
+
+    def newInstance(self):
+        self.instances += 1
+        return self.instances - 1
+
+
 class Writer(object):
-    instances = {}
-    wrote_elements = {}
     file_object = None
+    indents = IndentTable(INDENT)
 
     def __init__(self, comment=None):
         object.__init__(self)
         self.comment = comment
         self.indent_level = 0
-        self.counter = len(Writer.instances)
-        Writer.instances[self] = True
+        self.counter = SerializationContext.current().newInstance()
+
+    def writeFile(self, output, buffered=False):
+        Writer.writeTo(output, buffered, self.writeHeader, self.write)
 
-    def writeFile(self, output):
-        self.writeHeader(output)
-        self.write(output)
+    @staticmethod
+    def writeTo(output, buffered, *writers):
+        context = SerializationContext.current()
+        if buffered:
+            output = BufferedOutput(output)
+            context.encoding = None
+        try:
+            for write in writers:
+                write(output)
+        finally:
+            if buffered:
+                output.flush()
+                context.encoding = 'utf-8'
 
     def writeHeader(self, output):
-        output.write("#Ascii Scene\n".encode('utf-8'))
-        output.write("#Version 92\n".encode('utf-8'))
-        output.write(("#Generator osgexport %d.%d.%d\n\n" % VERSION).encode('utf-8'))
+        header = "#Ascii Scene\n" \
+                 "#Version 92\n" \
+                 "#Generator osgexport %d.%d.%d\n\n" % VERSION
+        encoding = SerializationContext.current().encoding
+        if encoding is not None:
+            header = header.encode(encoding)
+        output.write(header)
 
     def write(self, output):
         Writer.serializeInstanceOrUseIt(self, output)
 
     def encode(self, string):
+        indents = Writer.indents
+        if indents.indent != INDENT:
+            indents = Writer.indents = IndentTable(INDENT)
         text = string.replace("\t", "") \
-                     .replace("#", (" " * INDENT)) \
-                     .replace("$", (" " * (INDENT * self.indent_level)))
-        return text.encode('utf-8')
+                     .replace("#", indents[1]) \
+                     .replace("$", indents[self.indent_level])
+        encoding = SerializationContext.current().encoding
+        if encoding is None:
+            return text
+        return text.encode(encoding)
 
     def writeMatrix(self, output, matrix):
+        row = FloatFormat.get(FLOATPRE).row
         if bpy.app.version[0] >= 2 and bpy.app.version[1] >= 62:
             for i in range(0, 4):
-                output.write(self.encode("$##%s %s %s %s\n" % (STRFLT(matrix[0][i]),
-                                                               STRFLT(matrix[1][i]),
-                                                               STRFLT(matrix[2][i]),
-                                                               STRFLT(matrix[3][i]))))
+                output.write(self.encode("$##%s\n" % row((matrix[0][i], matrix[1][i], matrix[2][i], matrix[3][i]))))
         else:
             for i in range(0, 4):
-                output.write(self.encode("$##%s %s %s %s\n" % (STRFLT(matrix[i][0]),
-                                                               STRFLT(matrix[i][1]),
-                                                               STRFLT(matrix[i][2]),
-                                                               STRFLT(matrix[i][3]))))
+                output.write(self.encode("$##%s\n" % row(matrix[i][0:4])))
         output.write(self.encode("$#}\n"))
 
+    def writeValues(self, output, line, values, count):
+        # format ARRAY_CHUNK lines with a single % operation instead of one write per value,
+        # line is a template taking count values, trailing values that do not fill a line are dropped
+        encoding = SerializationContext.current().encoding
+        line = self.encode(line)
+        if encoding is not None:
+            line = line.decode(encoding)
+        step = ARRAY_CHUNK * count
+        end = len(values) - len(values) % count
+        for start in range(0, end, step):
+            chunk = values[start:min(start + step, end)]
+            text = line * (len(chunk) // count) % tuple(chunk)
+            output.write(text if encoding is None else text.encode(encoding))
+
     @staticmethod
     def resetWriter():
-        Writer.instances = {}
-        ArrayData.instance = 0
-        Object.instance = 0
+        SerializationContext.reset()
 
     @staticmethod
     def serializeInstanceOrUseIt(obj, output):
-        if obj in Writer.wrote_elements and \
+        wrote_elements = SerializationContext.current().wrote_elements
+        if obj in wrote_elements and \
            hasattr(obj, "uniqueID") and \
            obj.uniqueID is not None and \
            hasattr(obj, 'serializeReference'):
             return obj.serializeReference(output)
 
-        Writer.wrote_elements[obj] = True
-        return obj.serialize(output)
+        wrote_elements[obj] = True
+        spans = SerializationContext.current().spans
+        # objects created while writing are not shared, their python id can be reused in other processes
+        if spans is None or getattr(obj, "uniqueID", None) is None or not hasattr(obj, 'serializeReference') or \
+           obj.uniqueID >= DEFERRED_ID:
+            return obj.serialize(output)
+        start = output.tell()
+        obj.serialize(output)
+        reference = io.StringIO()
+        obj.serializeReference(reference)
+        spans.append((id(obj), start, output.tell(), reference.getvalue()))
 
 
 class Object(Writer):
-    instance = 0
-
     def __init__(self, *args, **kwargs):
         Writer.__init__(self, *args)
         self.dataVariance = "UNKNOWN"
@@ -138,8 +464,7 @@ class Object(Writer):
         self.userdata = None
 
     def generateID(self):
-        self.uniqueID = Object.instance
-        Object.instance += 1
+        self.uniqueID = SerializationContext.current().newObjectID()
 
     def copyFrom(self, obj):
         self.name = obj.name
@@ -319,9 +644,7 @@ class StackedTranslateElement(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        output.write(self.encode("$#Translate %s %s %s\n" % (STRFLT(self.translate[0]),
-                                                             STRFLT(self.translate[1]),
-                                                             STRFLT(self.translate[2]))))
+        output.write(self.encode("$#Translate %s\n" % FloatFormat.get(FLOATPRE).row(self.translate[0:3])))
 
 
 class StackedScaleElement(Object):
@@ -344,9 +667,7 @@ class StackedScaleElement(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        output.write(self.encode("$#Scale %s %s %s\n" % (STRFLT(self.scale[0]),
-                                                         STRFLT(self.scale[1]),
-                                                         STRFLT(self.scale[2]))))
+        output.write(self.encode("$#Scale %s\n" % FloatFormat.get(FLOATPRE).row(self.scale[0:3])))
 
 
 class StackedRotateAxisElement(Object):
@@ -369,9 +690,7 @@ class StackedRotateAxisElement(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        output.write(self.encode("$#Axis %s %s %s\n" % (STRFLT(self.axis[0]),
-                                                        STRFLT(self.axis[1]),
-                                                        STRFLT(self.axis[2]))))
+        output.write(self.encode("$#Axis %s\n" % FloatFormat.get(FLOATPRE).row(self.axis[0:3])))
         output.write(self.encode("$#Angle %s\n" % (STRFLT(self.angle))))
 
 
@@ -397,10 +716,10 @@ class StackedQuaternionElement(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        output.write(self.encode("$#Quaternion %s %s %s %s\n" % (STRFLT(self.quaternion.x),
-                                                                 STRFLT(self.quaternion.y),
-                                                                 STRFLT(self.quaternion.z),
-                                                                 STRFLT(self.quaternion.w))))
+        output.write(self.encode("$#Quaternion %s\n" % FloatFormat.get(FLOATPRE).row((self.quaternion.x,
+                                                                                    self.quaternion.y,
+                                                                                    self.quaternion.z,
+                                                                                    self.quaternion.w))))
 
 
 class UpdateMorph(Object):
@@ -498,6 +817,8 @@ class Node(Object):
         self.cullingActive = "TRUE"
         self.stateset = None
         self.update_callbacks = []
+        # bounding sphere as (center, radius)
+        self.initialBound = None
 
     def className(self):
         return "Node"
@@ -509,6 +830,13 @@ class Node(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
+        if self.initialBound is not None:
+            center, radius = self.initialBound
+            output.write(self.encode("$#InitialBound {\n"))
+            output.write(self.encode("$##Center %s\n" % FloatFormat.get(FLOATPRE).row(center)))
+            output.write(self.encode("$##Radius %s\n" % STRFLT(radius)))
+            output.write(self.encode("$#}\n"))
+
         if len(self.update_callbacks) > 0:
             output.write(self.encode("$#UpdateCallback TRUE {\n"))
             for i in self.update_callbacks:
@@ -576,6 +904,163 @@ class Group(Node):
             output.write(self.encode("$#}\n"))
 
 
+class GroupStream(object):
+    """
+    Serialize the children of a group as soon as they are complete. The osgt format
+    expects the children after the update callbacks and the stateset of the group, so
+    they are spooled to a temporary file until close writes the whole group.
+    """
+    def __init__(self, group, buffered=False):
+        object.__init__(self)
+        self.group = group
+        self.buffered = buffered
+        self.written = []
+        self.spool = tempfile.TemporaryFile()
+
+    def append(self, child):
+        child.indent_level = self.group.indent_level + 2
+        Writer.writeTo(self.spool, self.buffered, child.write)
+        self.written.append(child)
+
+    def contains(self, child):
+        return any(child is i for i in self.written)
+
+    def close(self, output):
+        """
+        Write the group with the streamed children followed by group.children
+        """
+        group = self.group
+        Writer.writeTo(output, self.buffered, group.writeHeader, self.writeGroupHead)
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, output)
+        self.spool.close()
+        Writer.writeTo(output, self.buffered, self.writeGroupTail)
+
+    def writeGroupHead(self, output):
+        group = self.group
+        output.write(group.encode("$%s {\n" % (group.getNameSpaceClass())))
+        Object.serializeContent(group, output)
+        Node.serializeContent(group, output)
+        if len(self.written) + len(group.children) > 0:
+            output.write(group.encode("$#Children %d {\n" % (len(self.written) + len(group.children))))
+
+    def writeGroupTail(self, output):
+        group = self.group
+        for i in group.children:
+            i.indent_level = group.indent_level + 2
+            i.write(output)
+        if len(self.written) + len(group.children) > 0:
+            output.write(group.encode("$#}\n"))
+        output.write(group.encode("$}\n"))
+
+
+# first id of the objects created while writing in a process of GroupParallelWriter
+DEFERRED_ID = 1 << 48
+DEFERRED_PATTERN = re.compile(r"UniqueID (\d+)")
+
+
+def serializeParallelChild(index):
+    # runs in a forked process, the children are inherited from GroupParallelWriter.group
+    group = GroupParallelWriter.group
+    child = group.children[index]
+    output = io.StringIO()
+    with SerializationContext() as context:
+        context.encoding = None
+        context.spans = []
+        context.object_id = DEFERRED_ID
+        child.indent_level = group.indent_level + 2
+        child.write(output)
+    if context.array_id:
+        raise Exception("arrays created while writing {}, their ids would differ from a serial write"
+                        .format(child.name))
+    return output.getvalue(), context.spans, context.object_id - DEFERRED_ID
+
+
+class GroupParallelWriter(object):
+    """
+    Serialize the children of a group in a pool of forked processes and concatenate them in order.
+    Unique ids are assigned when objects are created, what depends on the write order is which
+    occurrence of a shared object is written in full. Each process writes its child as if nothing
+    was written before and records the span of each object, then the objects already written by
+    the previous children are replaced by their reference so the output matches a serial write.
+    Objects created while writing, the images of the textures, get temporary ids which are
+    renumbered in the order a serial write would have allocated them.
+    """
+    group = None
+
+    def __init__(self, group, processes=None):
+        object.__init__(self)
+        self.group = group
+        self.processes = processes
+
+    @staticmethod
+    def available():
+        return "fork" in multiprocessing.get_all_start_methods()
+
+    def writeFile(self, output, buffered=False):
+        group = self.group
+        if not GroupParallelWriter.available() or self.processes == 1 or len(group.children) < 2:
+            return group.writeFile(output, buffered)
+
+        Writer.writeTo(output, buffered, group.writeHeader, self.writeGroupHead)
+        written = set(id(obj) for obj in SerializationContext.current().wrote_elements)
+        GroupParallelWriter.group = group
+        try:
+            with multiprocessing.get_context("fork").Pool(self.processes) as pool:
+                for text, spans, deferred in pool.imap(serializeParallelChild, range(len(group.children))):
+                    text = GroupParallelWriter.removeWritten(text, spans, written)
+                    if deferred:
+                        text = GroupParallelWriter.renumberDeferred(text)
+                    output.write(text.encode('utf-8'))
+        finally:
+            GroupParallelWriter.group = None
+        Writer.writeTo(output, buffered, self.writeGroupTail)
+
+    @staticmethod
+    def removeWritten(text, spans, written):
+        # spans are appended when an object is done, nested objects come before their parent
+        result = []
+        position = 0
+        for object_id, start, end, reference in sorted(spans, key=lambda span: (span[1], -span[2])):
+            if start < position:
+                continue
+            if object_id in written:
+                result.append(text[position:start])
+                result.append(reference)
+                position = end
+            else:
+                written.add(object_id)
+        result.append(text[position:])
+        return "".join(result)
+
+    @staticmethod
+    def renumberDeferred(text):
+        # temporary ids are replaced in the order of their first occurrence
+        context = SerializationContext.current()
+        ids = {}
+
+        def renumber(match):
+            object_id = int(match.group(1))
+            if object_id < DEFERRED_ID:
+                return match.group(0)
+            if object_id not in ids:
+                ids[object_id] = context.newObjectID()
+            return "UniqueID %d" % ids[object_id]
+        return DEFERRED_PATTERN.sub(renumber, text)
+
+    def writeGroupHead(self, output):
+        group = self.group
+        output.write(group.encode("$%s {\n" % (group.getNameSpaceClass())))
+        Object.serializeContent(group, output)
+        Node.serializeContent(group, output)
+        output.write(group.encode("$#Children %d {\n" % (len(group.children))))
+
+    def writeGroupTail(self, output):
+        group = self.group
+        output.write(group.encode("$#}\n"))
+        output.write(group.encode("$}\n"))
+
+
 class MatrixTransform(Group):
     def __init__(self, *args, **kwargs):
         Group.__init__(self, *args, **kwargs)
@@ -598,6 +1083,39 @@ class MatrixTransform(Group):
         self.writeMatrix(output, self.matrix)
 
 
+class LOD(Group):
+    # max range of the last child, FLT_MAX like osg::LOD
+    MAX_RANGE = 3.4028234663852886e+38
+
+    def __init__(self, *args, **kwargs):
+        Group.__init__(self, *args, **kwargs)
+        self.centerMode = "USE_BOUNDING_SPHERE_CENTER"
+        self.rangeMode = "DISTANCE_FROM_EYE_POINT"
+        # (min, max) distance of each child
+        self.ranges = []
+
+    def className(self):
+        return "LOD"
+
+    def serialize(self, output):
+        output.write(self.encode("$%s {\n" % (self.getNameSpaceClass())))
+        Object.serializeContent(self, output)
+        Node.serializeContent(self, output)
+        Group.serializeContent(self, output)
+        self.serializeContent(output)
+        output.write(self.encode("$}\n"))
+
+    def serializeContent(self, output):
+        output.write(self.encode("$#CenterMode %s\n" % self.centerMode))
+        output.write(self.encode("$#RangeMode %s\n" % self.rangeMode))
+        if len(self.ranges) > 0:
+            output.write(self.encode("$#RangeList %d {\n" % len(self.ranges)))
+            row = FloatFormat.get(FLOATPRE).row
+            for i in self.ranges:
+                output.write(self.encode("$##%s\n" % row(i)))
+            output.write(self.encode("$#}\n"))
+
+
 class StateAttribute(Object):
     def __init__(self, *args, **kwargs):
         Object.__init__(self, *args, **kwargs)
@@ -654,30 +1172,17 @@ class Light(StateAttribute):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
+        row = FloatFormat.get(FLOATPRE).row
         output.write(self.encode("$#LightNum %s\n" % self.light_num))
-        output.write(self.encode("$#Ambient %s %s %s %s\n" % (STRFLT(self.ambient[0]),
-                                                              STRFLT(self.ambient[1]),
-                                                              STRFLT(self.ambient[2]),
-                                                              STRFLT(self.ambient[3]))))
-
-        output.write(self.encode("$#Diffuse %s %s %s %s\n" % (STRFLT(self.diffuse[0]),
-                                                              STRFLT(self.diffuse[1]),
-                                                              STRFLT(self.diffuse[2]),
-                                                              STRFLT(self.diffuse[3]))))
-
-        output.write(self.encode("$#Specular %s %s %s %s\n" % (STRFLT(self.specular[0]),
-                                                               STRFLT(self.specular[1]),
-                                                               STRFLT(self.specular[2]),
-                                                               STRFLT(self.specular[3]))))
-
-        output.write(self.encode("$#Position %s %s %s %s\n" % (STRFLT(self.position[0]),
-                                                               STRFLT(self.position[1]),
-                                                               STRFLT(self.position[2]),
-                                                               STRFLT(self.position[3]))))
-
-        output.write(self.encode("$#Direction %s %s %s\n" % (STRFLT(self.direction[0]),
-                                                             STRFLT(self.direction[1]),
-                                                             STRFLT(self.direction[2]))))
+        output.write(self.encode("$#Ambient %s\n" % row(self.ambient[0:4])))
+
+        output.write(self.encode("$#Diffuse %s\n" % row(self.diffuse[0:4])))
+
+        output.write(self.encode("$#Specular %s\n" % row(self.specular[0:4])))
+
+        output.write(self.encode("$#Position %s\n" % row(self.position[0:4])))
+
+        output.write(self.encode("$#Direction %s\n" % row(self.direction[0:3])))
 
         output.write(self.encode("$#ConstantAttenuation %s\n" % STRFLT(self.constant_attenuation)))
         output.write(self.encode("$#LinearAttenuation %s\n" % STRFLT(self.linear_attenuation)))
@@ -778,42 +1283,19 @@ class Material(StateAttribute):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
+        row = FloatFormat.get(FLOATPRE).row
         StateAttribute.serializeContent(self, output)
-        output.write(self.encode("$#Ambient TRUE Front %s %s %s %s Back %s %s %s %s\n" % (STRFLT(self.ambient[0]),
-                                                                                          STRFLT(self.ambient[1]),
-                                                                                          STRFLT(self.ambient[2]),
-                                                                                          STRFLT(self.ambient[3]),
-                                                                                          STRFLT(self.ambient[0]),
-                                                                                          STRFLT(self.ambient[1]),
-                                                                                          STRFLT(self.ambient[2]),
-                                                                                          STRFLT(self.ambient[3]))))
-
-        output.write(self.encode("$#Diffuse TRUE Front %s %s %s %s Back %s %s %s %s\n" % (STRFLT(self.diffuse[0]),
-                                                                                          STRFLT(self.diffuse[1]),
-                                                                                          STRFLT(self.diffuse[2]),
-                                                                                          STRFLT(self.diffuse[3]),
-                                                                                          STRFLT(self.diffuse[0]),
-                                                                                          STRFLT(self.diffuse[1]),
-                                                                                          STRFLT(self.diffuse[2]),
-                                                                                          STRFLT(self.diffuse[3]))))
-
-        output.write(self.encode("$#Specular TRUE Front %s %s %s %s Back %s %s %s %s\n" % (STRFLT(self.specular[0]),
-                                                                                           STRFLT(self.specular[1]),
-                                                                                           STRFLT(self.specular[2]),
-                                                                                           STRFLT(self.specular[3]),
-                                                                                           STRFLT(self.specular[0]),
-                                                                                           STRFLT(self.specular[1]),
-                                                                                           STRFLT(self.specular[2]),
-                                                                                           STRFLT(self.specular[3]))))
-
-        output.write(self.encode("$#Emission TRUE Front %s %s %s %s Back %s %s %s %s\n" % (STRFLT(self.emission[0]),
-                                                                                           STRFLT(self.emission[1]),
-                                                                                           STRFLT(self.emission[2]),
-                                                                                           STRFLT(self.emission[3]),
-                                                                                           STRFLT(self.emission[0]),
-                                                                                           STRFLT(self.emission[1]),
-                                                                                           STRFLT(self.emission[2]),
-                                                                                           STRFLT(self.emission[3]))))
+        ambient = row(self.ambient[0:4])
+        output.write(self.encode("$#Ambient TRUE Front %s Back %s\n" % (ambient, ambient)))
+
+        diffuse = row(self.diffuse[0:4])
+        output.write(self.encode("$#Diffuse TRUE Front %s Back %s\n" % (diffuse, diffuse)))
+
+        specular = row(self.specular[0:4])
+        output.write(self.encode("$#Specular TRUE Front %s Back %s\n" % (specular, specular)))
+
+        emission = row(self.emission[0:4])
+        output.write(self.encode("$#Emission TRUE Front %s Back %s\n" % (emission, emission)))
 
         output.write(self.encode("$#Shininess TRUE Front %s Back %s\n" % (STRFLT(self.shininess),
                                                                           STRFLT(self.shininess))))
@@ -839,10 +1321,7 @@ class LightModel(StateAttribute):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        output.write(self.encode("$#AmbientIntensity %s %s %s %s\n" % (STRFLT(self.ambient[0]),
-                                                                       STRFLT(self.ambient[1]),
-                                                                       STRFLT(self.ambient[2]),
-                                                                       STRFLT(self.ambient[3]))))
+        output.write(self.encode("$#AmbientIntensity %s\n" % FloatFormat.get(FLOATPRE).row(self.ambient[0:4])))
         output.write(self.encode("$#ColorControl %s\n" % self.color_control))
         output.write(self.encode("$#LocalViewer %s\n" % self.local_viewer))
 
@@ -920,37 +1399,40 @@ class StateSet(Object):
 
 
 class ArrayData(Object):
-    instance = 0
-
     def __init__(self, *args, **kwargs):
         Object.__init__(self)
         self.array = kwargs.get('array')
         self.type = kwargs.get('type')
-        self.uniqueID = ArrayData.instance
-        ArrayData.instance += 1
+        self.uniqueID = SerializationContext.current().newArrayID()
 
     def serializeReference(self, output):
         output.write(self.encode("$Array TRUE ArrayID %d\n" % self.uniqueID))
 
     def serialize(self, output):
         output.write(self.encode("$Array TRUE ArrayID %s %s %d {\n" % (self.uniqueID, self.type, len(self.array))))
-        dim = len(self.array[0])
-        for i in self.array:
-            if dim == 3:
-                output.write(self.encode("$#%s %s %s\n" % (STRFLT(i[0]), STRFLT(i[1]), STRFLT(i[2]))))
-            elif dim == 2:
-                output.write(self.encode("$#%s %s\n" % (STRFLT(i[0]), STRFLT(i[1]))))
-            elif dim == 4:
-                output.write(self.encode("$#%s %s %s %s\n" % (STRFLT(i[0]), STRFLT(i[1]), STRFLT(i[2]), STRFLT(i[3]))))
+        if isinstance(self.array, VectorArray):
+            dim = self.array.dim
+        else:
+            dim = len(self.array[0])
+        if dim in (2, 3, 4):
+            self.serializeValues(output, dim)
         output.write(self.encode("$}\n"))
 
+    def serializeValues(self, output, dim):
+        line = "$#" + FloatFormat.get(FLOATPRE).template(dim) + "\n"
+        self.writeValues(output, line, flattenArray(self.array, dim), dim)
+
 
 class VertexAttributeData(Writer):
     def __init__(self, *args, **kwargs):
         Writer.__init__(self)
         self.array = None
-        if kwargs.get("array") is not None:
-            self.array = ArrayData(array=kwargs.get('array', None),
+        values = kwargs.get("array")
+        if values is not None:
+            if not isinstance(values, VectorArray):
+                dim = len(values[0]) if len(values) else ARRAY_DIMS[kwargs.get('type')]
+                values = VectorArray(dim, values)
+            self.array = ArrayData(array=values,
                                    type=kwargs.get('type', None))
 
     def getArray(self):
@@ -1011,21 +1493,21 @@ class TexCoordArray(VertexAttributeData):
 class DrawElements(Object):
     def __init__(self, *args, **kwargs):
         Object.__init__(self, *args, **kwargs)
-        self.indexes = []
+        self.indexes = IndexArray()
         self.type = None
 
+    def getMaxIndex(self):
+        if isinstance(self.indexes, IndexArray):
+            return self.indexes.max_index
+        return max(self.indexes) if len(self.indexes) else 0
+
     def getSizeArray(self):
-        # dont waste time here
-        # return max drawElements
-        # return "DrawElementsUInt"
-        element = "DrawElementsUByte"
-        for i in self.indexes:
-            if i > 255 and element == "DrawElementsUByte":
-                element = "DrawElementsUShort"
-            elif i > 65535 and element == "DrawElementsUShort":
-                element = "DrawElementsUInt"
-                break
-        return element
+        max_index = self.getMaxIndex()
+        if max_index > 65535:
+            return "DrawElementsUInt"
+        if max_index > 255:
+            return "DrawElementsUShort"
+        return "DrawElementsUByte"
 
     def className(self):
         return "DrawElements"
@@ -1039,12 +1521,8 @@ class DrawElements(Object):
         if self.type == "GL_QUADS":
             n = 4
 
-        total = int(len(self.indexes) / n)
-        for i in range(0, total):
-            output.write(self.encode("$##"))
-            for a in range(0, n):
-                output.write(self.encode("%s " % self.indexes[i * n + a]))
-            output.write(self.encode("\n"))
+        indexes = self.indexes.data if isinstance(self.indexes, IndexArray) else self.indexes
+        self.writeValues(output, "$##" + "%d " * n + "\n", indexes, n)
         output.write(self.encode("$#}\n"))
 
 
@@ -1059,6 +1537,8 @@ class Geometry(Object):
         self.uvs = OrderedDict()
         self.stateset = None
         self.update_callbacks = []
+        # bounding box as (minimum, maximum)
+        self.initialBound = None
 
     def className(self):
         return "Geometry"
@@ -1092,6 +1572,13 @@ class Geometry(Object):
             self.stateset.write(output)
             output.write(self.encode("$#}\n"))
 
+        if self.initialBound is not None:
+            row = FloatFormat.get(FLOATPRE).row
+            output.write(self.encode("$#InitialBound {\n"))
+            output.write(self.encode("$##Minimum %s\n" % row(self.initialBound[0])))
+            output.write(self.encode("$##Maximum %s\n" % row(self.initialBound[1])))
+            output.write(self.encode("$#}\n"))
+
         if len(self.primitives):
             output.write(self.encode("$#PrimitiveSetList %d {\n" % (len(self.primitives))))
             for i in self.primitives:
@@ -1236,6 +1723,8 @@ class MorphGeometry(Geometry):
     def __init__(self, *args, **kwargs):
         Geometry.__init__(self, *args, **kwargs)
         self.dataVariance = "DYNAMIC"
+        # RELATIVE targets hold offsets from the vertices instead of positions
+        self.method = "NORMALIZED"
         self.morphTargets = []
         self.update_callbacks = []
 
@@ -1253,6 +1742,8 @@ class MorphGeometry(Geometry):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
+        if self.method != "NORMALIZED":
+            output.write(self.encode("$#Method %s\n" % self.method))
         if self.morphTargets:
             output.write(self.encode("$#MorphTargets %s {\n" % len(self.morphTargets)))
             for target in self.morphTargets:
@@ -1354,8 +1845,8 @@ class VertexGroup(Object):
         output.write(self.encode("$}\n"))
 
     def serializeContent(self, output):
-        for i in self.vertexes:
-            output.write(self.encode("$#%s %s\n" % (i[0], STRFLT(i[1]))))
+        line = "$#%s " + FloatFormat.get(FLOATPRE).format + "\n"
+        self.writeValues(output, line, list(chain.from_iterable(self.vertexes)), 2)
 
 
 class Animation(Object):
@@ -1406,9 +1897,12 @@ class Channel(Object):
         output.write(self.encode("$#Name %s\n" % self.name))
         output.write(self.encode("$#TargetName \"%s\" \n" % self.target))
         output.write(self.encode("$#KeyFrameContainer TRUE %d {\n" % (len(self.keys))))
-        for i in self.keys:
-            output.write(self.encode("$##"))
-            for a in range(0, len(i)):
-                output.write(self.encode(" %s" % (STRFLT(i[a]))))
-            output.write(self.encode("\n"))
+        float_format = FloatFormat.get(FLOATPRE)
+        size = len(self.keys[0]) if self.keys else 0
+        if size > 0 and all(len(i) == size for i in self.keys):
+            line = "$## " + float_format.template(size) + "\n"
+            self.writeValues(output, line, list(chain.from_iterable(self.keys)), size)
+        else:
+            for i in self.keys:
+                output.write(self.encode("$##%s\n" % "".join(" " + float_format(a) for a in i)))
         output.write(self.encode("$#}\n"))
@@ -0,0 +1,42 @@
+# -*- python-indent: 4; mode: python -*-
+#
+# Micro benchmark of the float formatting used by the osgt serializers.
+# It does not need blender:
+#   python tests/bench-osgformat.py [precision]
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exporter", "osg"))
+from osgformat import FloatFormat
+
+precision = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+random.seed(0)
+values = [random.choice((0.0, 1.0, -1.0, random.uniform(-100, 100))) for i in range(30000)]
+rows = [values[i:i + 3] for i in range(0, len(values), 3)]
+
+STRFLT = lambda f: "%%.%df" % precision % float(f)
+float_format = FloatFormat.get(precision)
+row = float_format.row
+template = float_format.template(3)
+flat = values
+
+
+def bench(label, statement, reference=None):
+    elapsed = min(timeit.repeat(statement, number=5, repeat=5)) / 5
+    speedup = ""
+    if reference is not None:
+        speedup = " x%.1f" % (reference / elapsed)
+    print("{:<40} {:8.2f} ms{}".format(label, elapsed * 1000, speedup))
+    return elapsed
+
+
+print("{} floats, precision {}".format(len(values), precision))
+single = bench("STRFLT per value", lambda: [STRFLT(v) for v in values])
+bench("FloatFormat per value", lambda: [float_format(v) for v in values], single)
+rows_reference = bench("STRFLT rows", lambda: ["%s %s %s" % (STRFLT(r[0]), STRFLT(r[1]), STRFLT(r[2]))
+                                               for r in rows])
+bench("FloatFormat.row", lambda: [row(r) for r in rows], rows_reference)
+bench("FloatFormat.template bulk", lambda: ((template + "\n") * len(rows)) % tuple(flat), rows_reference)